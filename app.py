@@ -1,27 +1,156 @@
 import logging
-logging.basicConfig(level=logging.DEBUG)
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort
+from flask import (Flask, render_template, request, redirect, url_for, flash, jsonify, abort, Response,
+                   stream_with_context, make_response, session, g)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import joinedload
 from flask_migrate import Migrate  
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta, timezone, date
-from sqlalchemy import or_, extract
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from sqlalchemy import or_, and_, extract, event, text, func, case, update, select
+from sqlalchemy.engine import Engine
 from collections import defaultdict
+from functools import wraps
+import base64
+import csv
+import hashlib
+import io
+import json
 import os
+import secrets
+import sqlite3
+import threading
+from cachetools import TTLCache
+from budget_sheet import BudgetSheetCache, GoogleSheetClient
+from audit import BufferedAuditWriter
+from turn_seed import seed_turn_tasks, load_layout
+from mail_queue import MailWorker, smtp_connection_factory
+from metrics import RequestMetrics
+from fragment_cache import FragmentCache, MemoryBackend, DiskBackend
+from markupsafe import Markup
+from werkzeug.exceptions import HTTPException
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+
+def source_version():
+    paths = [__file__]
+    for folder, _, names in os.walk(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')):
+        paths.extend(os.path.join(folder, name) for name in names)
+    return str(int(max(os.path.getmtime(path) for path in paths)))
 
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///inventory.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///inventory.db')
 app.config['SECRET_KEY'] = 'secretkey'
+# Run on every new SQLite connection. WAL lets readers proceed during a write and
+# busy_timeout makes writers wait for the lock instead of failing with
+# "database is locked"; synchronous=NORMAL is durable under WAL. Set to {} to
+# get SQLite's defaults back.
+app.config['SQLITE_PRAGMAS'] = {
+    'journal_mode': 'WAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negative means KiB, so 64 MiB
+}
+# Connection pool per process. In-memory SQLite is a single shared connection,
+# so the pool settings only apply to file databases and servers.
+if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+    }
+# Dashboard pagination (rows per page, and the most a client may ask for)
+app.config['PARTS_PAGE_SIZE'] = 50
+app.config['PARTS_MAX_PAGE_SIZE'] = 500
+# Rendered parts-table fragments on the dashboard: 'memory' (per process), 'disk'
+# (one SQLite file shared by all workers on the host) or 'none'
+app.config['FRAGMENT_CACHE'] = os.environ.get('FRAGMENT_CACHE', 'memory')
+app.config['FRAGMENT_CACHE_SIZE'] = 256
+app.config['FRAGMENT_CACHE_PATH'] = os.path.join(app.instance_path, 'fragment_cache.db')
+# Use the part_fts index for dashboard search when running on SQLite
+app.config['PART_SEARCH_FTS'] = True
+# Orders listed per page when a month is expanded on /history
+app.config['HISTORY_PAGE_SIZE'] = 100
+# Delivered orders loaded per batch on /combined
+app.config['DELIVERED_PAGE_SIZE'] = 50
+# Rows fetched from the cursor (and written to the response) at a time by exports
+app.config['EXPORT_BATCH_SIZE'] = 1000
+# Mixed into every ETag and cached fragment key. The default is the newest
+# modification time of app.py and the templates, so a deploy re-renders pages
+# and fragments made with the old code; set BUILD_VERSION to pin it instead.
+app.config['BUILD_VERSION'] = os.environ.get('BUILD_VERSION') or source_version()
+# Warden log viewer page size
+app.config['LOGS_PAGE_SIZE'] = 100
+app.config['LOGS_MAX_PAGE_SIZE'] = 1000
+# Audit log writes: 'transaction' adds the ActionLog row to the caller's commit;
+# 'buffered' hands committed rows to a background writer that inserts batches.
+app.config['AUDIT_MODE'] = os.environ.get('AUDIT_MODE', 'transaction')
+app.config['AUDIT_BATCH_SIZE'] = 200
+app.config['AUDIT_FLUSH_INTERVAL'] = 2.0
+# Most (part_id, delta) pairs accepted by one /api/adjust call, and the largest
+# change one pair may make to a count
+app.config['ADJUST_MAX_ITEMS'] = 500
+app.config['ADJUST_MAX_DELTA'] = 1_000_000
+# Buildings, units and checklist for /turn/setup (format in turn_seed.py). Turn
+# setup refuses to run until this file exists.
+app.config['TURN_LAYOUT_PATH'] = os.environ.get('TURN_LAYOUT_PATH', os.path.join(app.instance_path, 'turn_layout.json'))
+# Seconds the /turn year and building dropdown options are cached per process,
+# and how many years' options are kept
+app.config['TURN_OPTIONS_TTL'] = 60
+app.config['TURN_OPTIONS_CACHE_SIZE'] = 32
+# Per-process cache of logged-in users for load_user (entries, seconds)
+app.config['USER_CACHE_SIZE'] = 1024
+app.config['USER_CACHE_TTL'] = 300
+# Budget sheet snapshot: served for up to BUDGET_CACHE_TTL seconds, refreshed in
+# the background every BUDGET_REFRESH_INTERVAL seconds (0 disables the thread)
+app.config['BUDGET_SHEET_KEY'] = "1-6FhHu-Sq9LXjJxGBYiMK353nKEiOzsZtVGcTG_to5Y"
+app.config['BUDGET_CACHE_TTL'] = 300
+app.config['BUDGET_REFRESH_INTERVAL'] = 300
+app.config['BUDGET_SNAPSHOT_PATH'] = os.path.join(app.instance_path, 'budget_snapshot.json')
+# Outbound mail: requests queue rows in outbound_email and a worker thread sends
+# them over one persistent SMTP connection. Credentials come from the environment.
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') != '0'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'villageinventorysystem@gmail.com')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'The Village IMS <villageinventorysystem@gmail.com>')
+# Set MAIL_WORKER=0 on web processes when a separate process drains the queue
+app.config['MAIL_WORKER'] = os.environ.get('MAIL_WORKER', '1') != '0'
+app.config['MAIL_BATCH_SIZE'] = 20
+app.config['MAIL_POLL_INTERVAL'] = 5.0
+app.config['MAIL_MAX_ATTEMPTS'] = 5
+app.config['MAIL_RETRY_BACKOFF'] = 30
+# Per-endpoint request/SQL metrics on /warden/metrics. METRICS_SAMPLE_RATE is the
+# fraction of requests measured; set METRICS_TOKEN to let a Prometheus scraper
+# read /metrics with "Authorization: Bearer <token>" instead of a warden login.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') != '0'
+app.config['METRICS_SAMPLE_RATE'] = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 #login spot
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+budget_sheet = BudgetSheetCache(GoogleSheetClient(app.config['BUDGET_SHEET_KEY']),
+                                app.config['BUDGET_SNAPSHOT_PATH'],
+                                ttl=app.config['BUDGET_CACHE_TTL'])
+request_metrics = RequestMetrics(sample_rate=app.config['METRICS_SAMPLE_RATE'])
+request_metrics.enabled = app.config['METRICS_ENABLED']
+request_metrics.init_app(app)
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
 
 class TurnTask(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,6 +163,9 @@ class TurnTask(db.Model):
     is_completed = db.Column(db.Boolean, default=False)
     completed_by = db.Column(db.String(100))
     completed_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_turn_task_year_building_floor', 'year', 'building', 'floor'),
+    )
 
 
 class User(db.Model, UserMixin):
@@ -57,8 +189,27 @@ class ActionLog(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     details = db.Column(db.Text)
     user = db.relationship('User')
+    # Newest-first paging on (timestamp, id), optionally filtered by user/entity/action.
+    __table_args__ = (
+        db.Index('ix_action_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_action_log_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_action_log_entity_timestamp', 'entity', 'timestamp'),
+        db.Index('ix_action_log_action_timestamp', 'action', 'timestamp'),
+    )
 
+# Call before the caller's own commit; the log row is written with (or, when
+# buffered, right after) that commit and dropped if it rolls back.
 def log_action(user, action, entity, entity_id, details=""):
+    if app.config['AUDIT_MODE'] == 'buffered':
+        db.session.info.setdefault('pending_audit', []).append(dict(
+            user_id=user.id,
+            action=action,
+            entity=entity,
+            entity_id=entity_id,
+            timestamp=datetime.utcnow(),
+            details=details
+        ))
+        return
     log = ActionLog(
         user_id=user.id,
         action=action,
@@ -67,11 +218,135 @@ def log_action(user, action, entity, entity_id, details=""):
         details=details
     )
     db.session.add(log)
-    db.session.commit()
-    
+
+def get_engine():
+    # Usable from background threads, which have no app context of their own.
+    with app.app_context():
+        return db.engine
+
+audit_writer = None
+
+def get_audit_writer():
+    global audit_writer
+    if audit_writer is None:
+        audit_writer = BufferedAuditWriter(get_engine, ActionLog.__table__,
+                                           max_batch=app.config['AUDIT_BATCH_SIZE'],
+                                           max_delay=app.config['AUDIT_FLUSH_INTERVAL'])
+    return audit_writer
+
+@event.listens_for(db.session, 'after_commit')
+def hand_off_audit_rows(session):
+    rows = session.info.pop('pending_audit', None)
+    if rows:
+        get_audit_writer().write(rows)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def drop_audit_rows(session, previous_transaction):
+    session.info.pop('pending_audit', None)
+
+class OutboundEmail(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(255), nullable=False)
+    from_address = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    __table_args__ = (
+        db.Index('ix_outbound_email_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+mail_worker = None
+
+def get_mail_worker():
+    global mail_worker
+    if mail_worker is None:
+        smtp_factory = smtp_connection_factory(app.config['MAIL_SERVER'], app.config['MAIL_PORT'],
+                                               app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'],
+                                               use_tls=app.config['MAIL_USE_TLS'])
+        mail_worker = MailWorker(get_engine, OutboundEmail.__table__, smtp_factory,
+                                 batch_size=app.config['MAIL_BATCH_SIZE'],
+                                 poll_interval=app.config['MAIL_POLL_INTERVAL'],
+                                 max_attempts=app.config['MAIL_MAX_ATTEMPTS'],
+                                 backoff=app.config['MAIL_RETRY_BACKOFF'])
+    return mail_worker
+
+# Queues an email with the caller's next commit; nothing is sent in the request.
+def queue_email(to_address, subject, body, from_address=None):
+    email = OutboundEmail(to_address=to_address,
+                          from_address=from_address or app.config['MAIL_DEFAULT_SENDER'],
+                          subject=subject,
+                          body=body)
+    db.session.add(email)
+    db.session.info['mail_queued'] = True
+    return email
+
+@event.listens_for(db.session, 'after_commit')
+def wake_mail_worker(session):
+    if session.info.pop('mail_queued', False) and app.config['MAIL_WORKER']:
+        worker = get_mail_worker()
+        worker.start()
+        worker.wake()
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def drop_mail_flag(session, previous_transaction):
+    session.info.pop('mail_queued', None)
+
+# What request handling needs from the logged-in user, detached from any session.
+# Views that change a user load the User row itself.
+class CachedUser(UserMixin):
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+user_cache = TTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+user_cache_lock = threading.Lock()
+user_cache_stats = {'hits': 0, 'misses': 0}
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    with user_cache_lock:
+        user = user_cache.get(user_id)
+        user_cache_stats['hits' if user is not None else 'misses'] += 1
+    if user is not None:
+        return user
+    row = db.session.query(User.id, User.username, User.role).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    user = CachedUser(*row)
+    with user_cache_lock:
+        user_cache[user_id] = user
+    return user
+
+def invalidate_user(user_id):
+    with user_cache_lock:
+        user_cache.pop(user_id, None)
+
+def user_cache_info():
+    with user_cache_lock:
+        return dict(user_cache_stats, size=len(user_cache), maxsize=user_cache.maxsize)
+
+# Any committed change to a user (password, role, email) drops its cache entry.
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def mark_user_changed(mapper, connection, target):
+    db.session.info.setdefault('changed_users', set()).add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        invalidate_user(user_id)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def drop_changed_users(session, previous_transaction):
+    session.info.pop('changed_users', None)
 
 # Data Model – Part plus OrderHistory for recording each purchase instance.
 class Part(db.Model):
@@ -80,37 +355,189 @@ class Part(db.Model):
     model_number = db.Column(db.String(50), unique=True, nullable=False)
     count = db.Column(db.Integer, default=0)
     cost = db.Column(db.Float)
-    room = db.Column(db.String(50))
+    room = db.Column(db.String(50), index=True)
     threshold = db.Column(db.Integer, default=5)  # Alert threshold for low stock
     is_misc = db.Column(db.Boolean, default=False)
-    appliance_type = db.Column(db.String(50))
+    appliance_type = db.Column(db.String(50), index=True)
     order_status = db.Column(db.String(50), default="Not Ordered")
     order_link = db.Column(db.String(255), nullable=True)
     tracking_number = db.Column(db.String(50), nullable=True)
     estimated_delivery = db.Column(db.Date, nullable=True)
     delivered_date = db.Column(db.Date, nullable=True)
+    # The low-stock set: a partial index holding only parts below threshold,
+    # kept current by the database on every count/threshold change. It covers
+    # /api/alerts so polling never touches the table itself.
+    __table_args__ = (
+        db.Index('ix_part_low_stock', 'room', 'id', 'name', 'model_number', 'count', 'threshold',
+                 sqlite_where=db.text('count < threshold'),
+                 postgresql_where=db.text('count < threshold')),
+    )
 
 
     @property
     def active_order(self):
+        # Latest undelivered order. List pages fill this in for every part at
+        # once with prefetch_active_orders(); otherwise it loads self.orders.
+        if '_active_order' in self.__dict__:
+            return self.__dict__['_active_order']
         undelivered = [order for order in self.orders if order.delivered_date is None]
         if undelivered:
-            undelivered.sort(key=lambda o: o.order_date, reverse=True)
+            undelivered.sort(key=lambda o: (o.order_date, o.id), reverse=True)
             return undelivered[0]
         return None
 
+# Full-text index over parts for the dashboard search box (SQLite FTS5). The
+# trigram tokenizer keeps the substring matching the old ILIKE search had, and
+# the triggers keep it in sync with the part table.
+PART_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS part_fts USING fts5("
+    "name, model_number, appliance_type, room, "
+    "content='part', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS part_fts_ai AFTER INSERT ON part BEGIN "
+    "INSERT INTO part_fts(rowid, name, model_number, appliance_type, room) "
+    "VALUES (new.id, new.name, new.model_number, new.appliance_type, new.room); END",
+    "CREATE TRIGGER IF NOT EXISTS part_fts_ad AFTER DELETE ON part BEGIN "
+    "INSERT INTO part_fts(part_fts, rowid, name, model_number, appliance_type, room) "
+    "VALUES ('delete', old.id, old.name, old.model_number, old.appliance_type, old.room); END",
+    "CREATE TRIGGER IF NOT EXISTS part_fts_au AFTER UPDATE OF name, model_number, appliance_type, room ON part BEGIN "
+    "INSERT INTO part_fts(part_fts, rowid, name, model_number, appliance_type, room) "
+    "VALUES ('delete', old.id, old.name, old.model_number, old.appliance_type, old.room); "
+    "INSERT INTO part_fts(rowid, name, model_number, appliance_type, room) "
+    "VALUES (new.id, new.name, new.model_number, new.appliance_type, new.room); END",
+]
+
+@event.listens_for(Part.__table__, 'after_create')
+def create_part_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        for statement in PART_FTS_DDL:
+            connection.exec_driver_sql(statement)
+
+@event.listens_for(Part.__table__, 'before_drop')
+def drop_part_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql("DROP TABLE IF EXISTS part_fts")
+
+def part_search_subquery(search):
+    # Ranked (part_id, rank) matches for the search box, or None when the FTS
+    # index can't serve this search and the caller should fall back to ILIKE.
+    if not app.config['PART_SEARCH_FTS'] or db.engine.dialect.name != 'sqlite':
+        return None
+    terms = search.split()
+    # Trigram matching needs at least three characters per term.
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    # Quote every term so user input is never parsed as FTS5 query syntax.
+    match = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+    return (text("SELECT rowid AS part_id, bm25(part_fts, 10.0, 10.0, 2.0, 1.0) AS rank "
+                 "FROM part_fts WHERE part_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(part_id=db.Integer, rank=db.Float)
+            .subquery('part_search'))
+
 # OrderHistory model with cascade deletion and relationship back to Part.
 class OrderHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    part_id = db.Column(db.Integer, db.ForeignKey('part.id'), nullable=False)
+    part_id = db.Column(db.Integer, db.ForeignKey('part.id'), nullable=False, index=True)
     order_date = db.Column(db.Date, default=date.today)
     purchased_quantity = db.Column(db.Integer, nullable=False)
     total_cost = db.Column(db.Float, nullable=False)
     tracking_number = db.Column(db.String(50))
     estimated_delivery = db.Column(db.Date, nullable=True)
-    delivered_date = db.Column(db.Date, nullable=True)
+    delivered_date = db.Column(db.Date, nullable=True, index=True)
     part = db.relationship("Part", backref=db.backref("orders", cascade="all, delete-orphan"))
     expense_line = db.Column(db.String(50))
+    # Orders still awaiting delivery, newest first per part (active_order, purchased list).
+    __table_args__ = (
+        db.Index('ix_order_history_undelivered', 'part_id', 'order_date',
+                 sqlite_where=db.text('delivered_date IS NULL'),
+                 postgresql_where=db.text('delivered_date IS NULL')),
+        # Covers the delivered total on /combined without touching the table.
+        db.Index('ix_order_history_delivered_cost', 'delivered_date', 'total_cost'),
+    )
+
+def prefetch_active_orders(parts):
+    # One query for the latest undelivered order of every part in the list,
+    # ranked per part with ROW_NUMBER() over the ix_order_history_undelivered
+    # index, instead of one orders query per part.
+    parts_by_id = {part.id: part for part in parts}
+    if not parts_by_id:
+        return parts
+    rank = func.row_number().over(partition_by=OrderHistory.part_id,
+                                  order_by=(OrderHistory.order_date.desc(), OrderHistory.id.desc()))
+    ranked = (select(OrderHistory.id, rank.label('rank'))
+              .where(OrderHistory.part_id.in_(parts_by_id), OrderHistory.delivered_date == None)
+              .subquery())
+    latest = {order.part_id: order for order in
+              OrderHistory.query.join(ranked, OrderHistory.id == ranked.c.id).filter(ranked.c.rank == 1)}
+    for part_id, part in parts_by_id.items():
+        part._active_order = latest.get(part_id)
+    return parts
+
+# Data versions: one token per table the inventory pages render, replaced inside
+# the same transaction as any change to that table (ORM flushes and bulk
+# insert/update/delete statements alike). Pages derive their ETag and cached
+# fragment keys from these, so a conditional GET is answered from this one
+# small table. Tokens are random rather than counters so a recreated, migrated
+# or restored database never repeats a version it (or another one) already
+# handed out against different data.
+VERSIONED_TABLES = ('part', 'order_history', 'turn_task')
+
+class DataVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+def new_data_version():
+    return secrets.randbelow(2 ** 31)
+
+@event.listens_for(DataVersion.__table__, 'after_create')
+def seed_data_versions(target, connection, **kw):
+    connection.execute(target.insert(), [{'name': name, 'version': new_data_version()}
+                                         for name in VERSIONED_TABLES])
+
+def bump_data_versions(connection, tables):
+    table = DataVersion.__table__
+    connection.execute(update(table)
+                       .where(table.c.name.in_(sorted(tables)))
+                       .values(version=new_data_version()))
+
+@event.listens_for(db.session, 'after_flush')
+def bump_flushed_versions(session, flush_context):
+    tables = {obj.__table__.name for obj in (*session.new, *session.dirty, *session.deleted)
+              if getattr(obj, '__table__', None) is not None} & set(VERSIONED_TABLES)
+    if tables:
+        bump_data_versions(session.connection(), tables)
+
+@event.listens_for(db.session, 'do_orm_execute')
+def bump_bulk_versions(orm_execute_state):
+    # update(Part), insert(TurnTask) etc. never reach the flush.
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and table.name in VERSIONED_TABLES:
+            bump_data_versions(orm_execute_state.session.connection(), {table.name})
+
+def data_versions(tables):
+    # A plain column select; no ORM objects are loaded.
+    table = DataVersion.__table__
+    return dict(db.session.execute(select(table.c.name, table.c.version).where(table.c.name.in_(tables))).all())
+
+fragment_cache = None
+
+def get_fragment_cache():
+    global fragment_cache
+    if fragment_cache is None:
+        kind = app.config['FRAGMENT_CACHE']
+        if kind == 'disk':
+            backend = DiskBackend(app.config['FRAGMENT_CACHE_PATH'], app.config['FRAGMENT_CACHE_SIZE'])
+        elif kind == 'memory':
+            backend = MemoryBackend(app.config['FRAGMENT_CACHE_SIZE'])
+        else:
+            return None
+        fragment_cache = FragmentCache(backend)
+    return fragment_cache
+
+def low_stock():
+    # Written exactly as the ix_part_low_stock predicate so the index is used.
+    return Part.count < Part.threshold
 
 ROOMS = {
     "Kitchen": ["Oven", "Fridge", "Garbage Disposal", "Microwave", "Faucet", "Other"],
@@ -122,24 +549,167 @@ ROOMS = {
     "Other": ["Miscellaneous"]
 }
 
+# Keyset pagination cursors: an opaque, url-safe token holding the sort key of
+# the last row on the previous page.
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(token, *types):
+    # types gives the allowed type (or tuple of types) of each value. A
+    # malformed or tampered token decodes to None, i.e. the first page.
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(types):
+        return None
+    for value, allowed in zip(values, types):
+        if isinstance(value, bool) or not isinstance(value, allowed):
+            return None
+    return values
+
+def page_size_arg(default_key, max_key):
+    per_page = request.args.get('per_page', app.config[default_key], type=int)
+    if not per_page or per_page < 1:
+        per_page = app.config[default_key]
+    return min(per_page, app.config[max_key])
+
+# Integers taken from JSON bodies must fit a signed 64-bit column.
+def is_db_int(value):
+    return type(value) is int and -2 ** 63 <= value < 2 ** 63
+
+def keyset_after(key, row_id, values, descending=False):
+    # Rows that sort after (key, id) in ORDER BY key, id -- or key DESC, id DESC.
+    # NULL keys sort first ascending and last descending, as in SQLite.
+    value, last_id = values
+    if descending:
+        if value is None:
+            return and_(key == None, row_id < last_id)
+        return or_(key < value, key == None, and_(key == value, row_id < last_id))
+    if value is None:
+        return or_(key != None, and_(key == None, row_id > last_id))
+    return or_(key > value, and_(key == value, row_id > last_id))
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+def export_response(filename, fmt, columns, stmt):
+    # Streams the rows of stmt as CSV or JSONL. Rows come off the cursor in
+    # EXPORT_BATCH_SIZE chunks and go out as they are formatted, so memory use
+    # doesn't grow with the export.
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        rows = db.session.execute(stmt.execution_options(yield_per=batch_size))
+        for i, row in enumerate(rows, 1):
+            values = [value.isoformat() if isinstance(value, date) else value for value in row]
+            if fmt == 'csv':
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values))) + '\n')
+            if i % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'})
+
+def parse_day(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def day_after(day):
+    # Exclusive upper bound for an inclusive end date; None (no bound) for
+    # date.max, which has no next day.
+    return day + timedelta(days=1) if day < date.max else None
+
+def conditional_get(*tables):
+    # ETag from the data versions of the tables a page reads, plus the URL and
+    # who is asking (pages differ by user and role). A client already holding
+    # the current version gets a 304 before the view runs. Pages carrying a
+    # flash message are always rendered.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if '_flashes' in session:
+                return view(*args, **kwargs)
+            versions = g.data_versions = data_versions(tables)
+            key = json.dumps([app.config['BUILD_VERSION'], date.today().isoformat(), request.full_path,
+                              current_user.id, current_user.username, current_user.role,
+                              sorted(versions.items())])
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+                response.set_etag(etag)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
 @app.route('/')
 @login_required
+@conditional_get('part', 'order_history')
 def index():
     search = request.args.get('search', '')
     room_filter = request.args.get('room', '')
     appliance_filter = request.args.get('appliance', '')
+    per_page = page_size_arg('PARTS_PAGE_SIZE', 'PARTS_MAX_PAGE_SIZE')
+    after = request.args.get('after', '')
     query = Part.query
+    sort_key = Part.room
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(or_(Part.name.ilike(search_term),
-                                 Part.model_number.ilike(search_term)))
+        matches = part_search_subquery(search)
+        if matches is not None:
+            # Best matches first when searching.
+            query = query.join(matches, matches.c.part_id == Part.id)
+            sort_key = matches.c.rank
+        else:
+            search_term = f"%{search}%"
+            query = query.filter(or_(Part.name.ilike(search_term),
+                                     Part.model_number.ilike(search_term)))
     if room_filter:
-        query = query.filter_by(room=room_filter)
+        query = query.filter(Part.room == room_filter)
     if appliance_filter:
-        query = query.filter_by(appliance_type=appliance_filter)
-    parts = query.order_by(Part.room).all()
-    alerts = [p for p in parts if p.count < p.threshold]
-    return render_template('index.html', parts=parts, alerts=alerts, 
+        query = query.filter(Part.appliance_type == appliance_filter)
+
+    # The rendered table is cached under the part data version, so any change
+    # to a part makes every cached page miss; a hit skips the page query too.
+    fragments = get_fragment_cache()
+    versions = g.get('data_versions') or data_versions(['part'])
+    fragment_key = ('parts_table', app.config['BUILD_VERSION'], search, room_filter, appliance_filter,
+                    per_page, after, versions['part'])
+    parts_table = fragments.get(fragment_key) if fragments else None
+    if parts_table is None:
+        # Fetch one extra row to know whether there is a next page.
+        page_query = query
+        # The sort key is the room, or the search rank when searching.
+        cursor = decode_cursor(after, (str, int, float, type(None)), int)
+        if cursor:
+            page_query = page_query.filter(keyset_after(sort_key, Part.id, cursor))
+        rows = page_query.add_columns(sort_key).order_by(sort_key, Part.id).limit(per_page + 1).all()
+        next_cursor = None
+        if len(rows) > per_page:
+            rows = rows[:per_page]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][0].id)
+        parts_table = render_template('_parts_table.html', parts=[row[0] for row in rows],
+                                      selected_room=room_filter, selected_appliance=appliance_filter, search=search,
+                                      per_page=per_page, after=after, next_cursor=next_cursor)
+        if fragments:
+            fragments.set(fragment_key, parts_table)
+
+    # Alerts cover every matching part, not just the rows on this page.
+    alerts = query.filter(low_stock()).order_by(sort_key, Part.id).all()
+    return render_template('index.html', parts_table=Markup(parts_table), alerts=alerts,
                            rooms=ROOMS, selected_room=room_filter, selected_appliance=appliance_filter, search=search)
 
 @app.route('/add', methods=['GET', 'POST'])
@@ -165,11 +735,13 @@ def add_part():
                 order_link=request.form.get('order_link', '')
             )
             db.session.add(part)
-            db.session.commit()
+            db.session.flush()
             log_action(current_user, "create", "Part", part.id, f"Added {part.name}")
+            db.session.commit()
             flash(f'Added part: {part.name}', "success")
             return redirect(url_for('index'))
         except Exception as e:
+            db.session.rollback()
             flash(f'Error adding part: {str(e)}', "danger")
             return redirect(url_for('add_part'))
     recent_parts = Part.query.order_by(Part.id.desc()).limit(10).all()
@@ -194,11 +766,12 @@ def update_part(part_id):
             part.is_misc = 'is_misc' in request.form
             part.appliance_type = request.form.get('appliance_type', '')
             part.order_link = request.form.get('order_link', part.order_link)
-            db.session.commit()
             log_action(current_user, "update", "Part", part.id, f"Updated {part.name}")
+            db.session.commit()
             flash(f'Updated part: {part.name}', "success")
             return redirect(url_for('index'))
         except Exception as e:
+            db.session.rollback()
             flash(f'Error updating part: {str(e)}', "danger")
             return redirect(url_for('update_part', part_id=part_id))
     return render_template('update_part.html', part=part, rooms=ROOMS)
@@ -211,70 +784,172 @@ def delete_part(part_id):
         flash("Part not found.", "warning")
     else:
         db.session.delete(part)
-        db.session.commit()
         log_action(current_user, "delete", "Part", part.id, f"Deleted {part.name}")
+        db.session.commit()
         flash(f"Deleted part: {part.name}", "success")
     return redirect(url_for('index'))
 
+def adjust_part_count(part_id, delta):
+    # Atomic count = count + delta, refused if it would take the count below 0.
+    # Returns the new count, or None if the part is missing or the guard failed.
+    # Part of the caller's transaction; the caller commits.
+    new_count = func.coalesce(Part.count, 0) + delta
+    stmt = (update(Part)
+            .where(Part.id == part_id, new_count >= 0)
+            .values(count=new_count)
+            .execution_options(synchronize_session=False))
+    if db.engine.dialect.update_returning:
+        return db.session.execute(stmt.returning(Part.count)).scalar()
+    if db.session.execute(stmt).rowcount == 0:
+        return None
+    return db.session.query(Part.count).filter(Part.id == part_id).scalar()
+
+def part_exists(part_id):
+    return db.session.query(Part.id).filter(Part.id == part_id).first() is not None
+
 @app.route('/api/increment/<int:part_id>', methods=['GET', 'POST'])
 @login_required
 def api_increment_part(part_id):
-    part = db.session.get(Part, part_id)
-    if part:
-        part.count += 1
+    new_count = adjust_part_count(part_id, 1)
+    if new_count is not None:
+        log_action(current_user, "increment", "Part", part_id, f"Count changed to {new_count}")
         db.session.commit()
-        log_action(current_user, "increment", "Part", part.id, f"Count changed to {part.count}")
         if request.method == 'GET':
             return redirect(url_for('index'))
-        return jsonify({'success': True, 'new_count': part.count})
+        return jsonify({'success': True, 'new_count': new_count})
     return jsonify({'success': False, 'error': 'Part not found'}), 404
 
 @app.route('/api/decrement/<int:part_id>', methods=['GET', 'POST'])
 @login_required
 def api_decrement_part(part_id):
-    part = db.session.get(Part, part_id)
-    if part:
-        if part.count > 0:
-            part.count -= 1
-            db.session.commit()
-            log_action(current_user, "decrement", "Part", part.id, f"Count changed to {part.count}")
-            if request.method == 'GET':
-                return redirect(url_for('index'))
-            return jsonify({'success': True, 'new_count': part.count})
-        else:
-            if request.method == 'GET':
-                flash("Part count is already 0.", "warning")
-                return redirect(url_for('index'))
-            return jsonify({'success': False, 'error': 'Count already 0'}), 400
+    new_count = adjust_part_count(part_id, -1)
+    if new_count is not None:
+        log_action(current_user, "decrement", "Part", part_id, f"Count changed to {new_count}")
+        db.session.commit()
+        if request.method == 'GET':
+            return redirect(url_for('index'))
+        return jsonify({'success': True, 'new_count': new_count})
+    if part_exists(part_id):
+        if request.method == 'GET':
+            flash("Part count is already 0.", "warning")
+            return redirect(url_for('index'))
+        return jsonify({'success': False, 'error': 'Count already 0'}), 400
     if request.method == 'GET':
         flash("Part not found.", "danger")
         return redirect(url_for('index'))
     return jsonify({'success': False, 'error': 'Part not found'}), 404
 
+# Batch stock adjustment for scanners: {"adjustments": [{"part_id": 1, "delta": -2}, ...]}
+# Every pair is applied in one transaction; each gets its own result.
+@app.route('/api/adjust', methods=['POST'])
+@login_required
+def api_adjust_parts():
+    payload = request.get_json(silent=True) or {}
+    adjustments = payload.get('adjustments') if isinstance(payload, dict) else None
+    if not isinstance(adjustments, list) or not adjustments:
+        return jsonify({'success': False, 'error': 'Expected a non-empty "adjustments" list'}), 400
+    if len(adjustments) > app.config['ADJUST_MAX_ITEMS']:
+        return jsonify({'success': False, 'error': f"At most {app.config['ADJUST_MAX_ITEMS']} adjustments per request"}), 400
+
+    results = []
+    for item in adjustments:
+        part_id = item.get('part_id') if isinstance(item, dict) else None
+        delta = item.get('delta') if isinstance(item, dict) else None
+        if not is_db_int(part_id) or type(delta) is not int:
+            results.append({'part_id': part_id, 'success': False, 'error': 'part_id and delta must be integers'})
+            continue
+        if abs(delta) > app.config['ADJUST_MAX_DELTA']:
+            results.append({'part_id': part_id, 'success': False,
+                            'error': f"delta must be between -{app.config['ADJUST_MAX_DELTA']} and {app.config['ADJUST_MAX_DELTA']}"})
+            continue
+        new_count = adjust_part_count(part_id, delta)
+        if new_count is None:
+            error = 'Count would go below 0' if part_exists(part_id) else 'Part not found'
+            results.append({'part_id': part_id, 'success': False, 'error': error})
+            continue
+        log_action(current_user, "adjust", "Part", part_id, f"Count changed by {delta:+d} to {new_count}")
+        results.append({'part_id': part_id, 'success': True, 'new_count': new_count})
+    db.session.commit()
+    return jsonify({'success': all(r['success'] for r in results), 'results': results})
+
+
 
 
+# Low-stock parts for wall displays; reads only the ix_part_low_stock index.
+@app.route('/api/alerts')
+@login_required
+@conditional_get('part')
+def api_alerts():
+    rows = (db.session.query(Part.id, Part.name, Part.model_number, Part.room, Part.count, Part.threshold)
+            .filter(low_stock())
+            .order_by(Part.room, Part.id)
+            .all())
+    alerts = [row._asdict() for row in rows]
+    return jsonify({'count': len(alerts), 'alerts': alerts})
 
 # Combined Orders, Purchases & Delivered History Route
 @app.route('/combined')
 @login_required
+@conditional_get('part', 'order_history')
 def combined_orders():
     # Pending orders: only show if count is below threshold, order_status "Not Ordered", and has an order_link.
     pending_orders = Part.query.filter(
         Part.order_link != None,
         Part.order_status == "Not Ordered",
-        Part.count < Part.threshold
+        low_stock()
     ).all()
     # Purchased orders: OrderHistory records with no delivered_date (pending delivery)
-    purchased_orders = OrderHistory.query.filter(OrderHistory.delivered_date == None).all()
-    # Delivered orders: OrderHistory records with delivered_date
-    delivered_orders = OrderHistory.query.filter(OrderHistory.delivered_date != None).all()
-    overall_total = sum(order.total_cost for order in delivered_orders)
+    purchased_orders = (OrderHistory.query
+                        .options(joinedload(OrderHistory.part))
+                        .filter(OrderHistory.delivered_date == None)
+                        .order_by(OrderHistory.order_date, OrderHistory.id)
+                        .all())
+    # Delivered orders: the newest page here, older ones fetched from /combined/delivered.
+    delivered_orders, next_cursor = delivered_orders_page(None)
+    overall_total = (db.session.query(func.coalesce(func.sum(OrderHistory.total_cost), 0))
+                     .filter(OrderHistory.delivered_date != None)
+                     .scalar())
     return render_template('combined.html',
                            pending_orders=pending_orders,
                            purchased_orders=purchased_orders,
                            delivered_orders=delivered_orders,
+                           next_cursor=next_cursor,
                            overall_total=overall_total)
 
+def delivered_orders_page(after):
+    # Newest deliveries first, keyset-paged on (delivered_date, id); after is that pair.
+    per_page = app.config['DELIVERED_PAGE_SIZE']
+    query = (OrderHistory.query
+             .options(joinedload(OrderHistory.part))
+             .filter(OrderHistory.delivered_date != None))
+    if after:
+        delivered, last_id = after
+        query = query.filter(or_(OrderHistory.delivered_date < delivered,
+                                 and_(OrderHistory.delivered_date == delivered, OrderHistory.id < last_id)))
+    orders = (query.order_by(OrderHistory.delivered_date.desc(), OrderHistory.id.desc())
+              .limit(per_page + 1)
+              .all())
+    next_cursor = None
+    if len(orders) > per_page:
+        orders = orders[:per_page]
+        last = orders[-1]
+        next_cursor = encode_cursor(last.delivered_date.isoformat(), last.id)
+    return orders, next_cursor
+
+# Older delivered rows for the "Load more" button on /combined.
+@app.route('/combined/delivered')
+@login_required
+@conditional_get('part', 'order_history')
+def combined_delivered():
+    after = decode_cursor(request.args.get('after'), str, int)
+    try:
+        after = after and (date.fromisoformat(after[0]), after[1])
+    except ValueError:
+        after = None
+    orders, next_cursor = delivered_orders_page(after)
+    return jsonify({'html': render_template('_delivered_rows.html', delivered_orders=orders),
+                    'next_cursor': next_cursor})
+
 @app.route('/purchase/update/<int:part_id>', methods=['GET', 'POST'])
 @login_required
 def purchase_update(part_id):
@@ -342,25 +1017,83 @@ def api_deliver(order_id):
     db.session.commit()
     return jsonify({'success': True, 'new_count': part.count})
 
-# History Route: Display delivered orders grouped by month for a given year.
+# History Route: Monthly delivered totals for a given year; a month's orders are
+# only loaded when that month is expanded (?month=N), one page at a time.
 @app.route('/history')
 @login_required
 def history():
     year = request.args.get('year', datetime.today().year, type=int)
-    delivered_orders = OrderHistory.query.filter(OrderHistory.delivered_date != None).all()
+    # Keep year + 1 within what date() accepts.
+    year = min(max(year, date.min.year), date.max.year - 1)
+    selected_month = request.args.get('month', type=int)
+    if selected_month not in range(1, 13):
+        selected_month = None
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = app.config['HISTORY_PAGE_SIZE']
+
     history_data = {}
     for m in range(1, 13):
         history_data[m] = {
             'orders': [],
+            'order_count': 0,
             'total_cost': 0.0
         }
-    for order in delivered_orders:
-        if order.delivered_date.year == year:
-            month = order.delivered_date.month
-            history_data[month]['orders'].append(order)
-            history_data[month]['total_cost'] += order.total_cost
+    # Range on delivered_date (not extract(year) = ...) so the index is used.
+    year_start, year_end = date(year, 1, 1), date(year + 1, 1, 1)
+    month = extract('month', OrderHistory.delivered_date)
+    monthly = (db.session.query(month, func.count(OrderHistory.id), func.sum(OrderHistory.total_cost))
+               .filter(OrderHistory.delivered_date >= year_start, OrderHistory.delivered_date < year_end)
+               .group_by(month)
+               .all())
+    for m, order_count, total_cost in monthly:
+        history_data[int(m)]['order_count'] = order_count
+        history_data[int(m)]['total_cost'] = total_cost or 0.0
+
+    has_next = False
+    if selected_month:
+        # Past the last page shows the last page (and keeps the OFFSET in range).
+        last_page = max(1, -(-history_data[selected_month]['order_count'] // per_page))
+        page = min(page, last_page)
+        month_start = date(year, selected_month, 1)
+        month_end = date(year + 1, 1, 1) if selected_month == 12 else date(year, selected_month + 1, 1)
+        orders = (OrderHistory.query
+                  .options(joinedload(OrderHistory.part))
+                  .filter(OrderHistory.delivered_date >= month_start, OrderHistory.delivered_date < month_end)
+                  .order_by(OrderHistory.delivered_date, OrderHistory.id)
+                  .offset((page - 1) * per_page)
+                  .limit(per_page + 1)
+                  .all())
+        has_next = len(orders) > per_page
+        history_data[selected_month]['orders'] = orders[:per_page]
+
     overall_total = sum(history_data[m]['total_cost'] for m in history_data)
-    return render_template('history.html', history_data=history_data, overall_total=overall_total, year=year)
+    return render_template('history.html', history_data=history_data, overall_total=overall_total, year=year,
+                           selected_month=selected_month, page=page, has_next=has_next)
+
+# Spend export for accounting. Dates filter order_date, or delivered_date with
+# by=delivered (as /history and /budget count spend); end is inclusive.
+@app.route('/export/orders.<any(csv, jsonl):fmt>')
+@login_required
+def export_orders(fmt):
+    date_column = OrderHistory.delivered_date if request.args.get('by') == 'delivered' else OrderHistory.order_date
+    columns = ['id', 'order_date', 'delivered_date', 'model_number', 'part_name', 'purchased_quantity',
+               'total_cost', 'expense_line', 'tracking_number', 'estimated_delivery']
+    stmt = (select(OrderHistory.id, OrderHistory.order_date, OrderHistory.delivered_date, Part.model_number,
+                   Part.name, OrderHistory.purchased_quantity, OrderHistory.total_cost,
+                   OrderHistory.expense_line, OrderHistory.tracking_number, OrderHistory.estimated_delivery)
+            .join(Part, OrderHistory.part_id == Part.id)
+            .order_by(OrderHistory.id))
+    try:
+        if request.args.get('start'):
+            stmt = stmt.where(date_column >= parse_day(request.args['start']))
+        end = day_after(parse_day(request.args['end'])) if request.args.get('end') else None
+        if end is not None:
+            stmt = stmt.where(date_column < end)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    if request.args.get('expense_line'):
+        stmt = stmt.where(OrderHistory.expense_line == request.args['expense_line'])
+    return export_response('orders', fmt, columns, stmt)
 
 # Order Edit Route: Allows editing of a pending OrderHistory record.
 @app.route('/order/edit/<int:order_id>', methods=['GET', 'POST'])
@@ -416,15 +1149,6 @@ def budget():
     quarter_label = f"Q{selected_quarter}"
     quarter_range = f"{quarter_start.strftime('%b %d')} – {quarter_end.strftime('%b %d, %Y')}"
 
-    # Spreadsheet setup
-    import socket
-    hostname = socket.gethostname()
-    credentials_file = "credentials.json" if "ip-" in hostname else "dev_credentials.json"
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(credentials_file, scope)
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key("1-6FhHu-Sq9LXjJxGBYiMK353nKEiOzsZtVGcTG_to5Y").sheet1
-
     # Month labels in the spreadsheet (Row 1)
     quarter_months = {
         1: ["JAN", "FEB", "MARCH"],
@@ -460,9 +1184,15 @@ def budget():
 
     category_totals = {group: {"budget": 0, "spent": 0} for group in category_map}
 
-    values = sheet.get_all_values()
+    # Budget figures come from the cached sheet snapshot, not a live fetch.
+    budget_sheet.start_refresher(app.config['BUDGET_REFRESH_INTERVAL'])
+    values, fetched_at = budget_sheet.get_values()
+    if not values:
+        flash("The budget sheet is unavailable right now; budget figures are missing.", "warning")
+        values = [[]]
     headers = values[0]
     rows = values[1:]
+    budget_updated_at = datetime.fromtimestamp(fetched_at) if fetched_at else None
 
     # Budget lookup using month names
     for row in rows:
@@ -511,7 +1241,8 @@ def budget():
         over_budget=over_budget,
         is_over=spent_total > overall_budget,
         percent_spent=percent_spent,
-        category_totals=category_totals
+        category_totals=category_totals,
+        budget_updated_at=budget_updated_at
     )
 
 #logout route
@@ -522,46 +1253,103 @@ def logout():
     flash("You’ve been logged out.", "info")
     return redirect(url_for('login'))
 
+def usage_by_window(windows):
+    # Delivered quantity and cost per part for each named (start, end) window,
+    # end exclusive or None, all summed in one GROUP BY over order_history.
+    columns = []
+    for name, (start, end) in windows.items():
+        in_window = OrderHistory.delivered_date >= start
+        if end is not None:
+            in_window = and_(in_window, OrderHistory.delivered_date < end)
+        columns.append(func.coalesce(func.sum(case((in_window, OrderHistory.purchased_quantity), else_=0)), 0)
+                       .label(f'{name}_used'))
+        columns.append(func.coalesce(func.sum(case((in_window, OrderHistory.total_cost), else_=0.0)), 0.0)
+                       .label(f'{name}_cost'))
+    # Only join the orders that can fall in some window.
+    earliest = min(start for start, _ in windows.values())
+    rows = (db.session.query(Part, *columns)
+            .outerjoin(OrderHistory, and_(OrderHistory.part_id == Part.id,
+                                          OrderHistory.delivered_date >= earliest))
+            .group_by(Part.id)
+            .order_by(Part.id)
+            .all())
+    usage = []
+    for row in rows:
+        item = {'part': row[0]}
+        item.update({key: value for key, value in row._mapping.items() if key.endswith(('_used', '_cost'))})
+        usage.append(item)
+    return usage
+
 @app.route('/trends')
 @login_required
 def trends():
-    from collections import defaultdict
-    from datetime import date, timedelta
-
     today = date.today()
     start_of_week = today - timedelta(days=today.weekday())
     start_of_month = today.replace(day=1)
     quarter = (today.month - 1) // 3 + 1
     start_of_quarter = date(today.year, 3 * (quarter - 1) + 1, 1)
+    windows = {
+        'week': (start_of_week, None),
+        'month': (start_of_month, None),
+        'quarter': (start_of_quarter, None),
+    }
 
-    parts = Part.query.all()
-    usage = []
-
-    for part in parts:
-        orders = part.orders
-        week_used = sum(o.purchased_quantity for o in orders if o.delivered_date and o.delivered_date >= start_of_week)
-        month_used = sum(o.purchased_quantity for o in orders if o.delivered_date and o.delivered_date >= start_of_month)
-        quarter_used = sum(o.purchased_quantity for o in orders if o.delivered_date and o.delivered_date >= start_of_quarter)
-        quarter_cost = sum(o.total_cost for o in orders if o.delivered_date and o.delivered_date >= start_of_quarter)
-
-        usage.append({
-            'part': part,
-            'week_used': week_used,
-            'month_used': month_used,
-            'quarter_used': quarter_used,
-            'quarter_cost': quarter_cost
-        })
+    # Optional user-selected window, e.g. ?start=2025-01-01&end=2025-06-30 (end inclusive)
+    custom_start = custom_end = None
+    try:
+        if request.args.get('start'):
+            custom_start = datetime.strptime(request.args['start'], "%Y-%m-%d").date()
+        if request.args.get('end'):
+            custom_end = datetime.strptime(request.args['end'], "%Y-%m-%d").date()
+    except ValueError:
+        flash("Invalid date range.", "danger")
+        custom_start = custom_end = None
+    if custom_start or custom_end:
+        windows['custom'] = (custom_start or date.min,
+                             day_after(custom_end) if custom_end else None)
+
+    usage = usage_by_window(windows)
 
     total_quarter_cost = sum(item['quarter_cost'] for item in usage)
     for item in usage:
         item['budget_pct'] = round((item['quarter_cost'] / total_quarter_cost) * 100, 1) if total_quarter_cost > 0 else 0
 
-    return render_template("trends.html", usage=usage, total_quarter_cost=total_quarter_cost)
+    return render_template("trends.html", usage=usage, total_quarter_cost=total_quarter_cost,
+                           custom_start=custom_start, custom_end=custom_end,
+                           has_custom='custom' in windows)
+
+# Year and building dropdowns for /turn, from SELECT DISTINCT and cached per
+# process, one entry per year viewed. Cleared whenever turn tasks are added or
+# removed (and after a TTL, for changes made by other workers).
+turn_options_cache = TTLCache(maxsize=app.config['TURN_OPTIONS_CACHE_SIZE'], ttl=app.config['TURN_OPTIONS_TTL'])
+turn_options_lock = threading.Lock()
+
+def turn_filter_options(year):
+    with turn_options_lock:
+        cached = turn_options_cache.get(year)
+    if cached:
+        return cached
+    available_years = [y for (y,) in db.session.query(TurnTask.year).distinct().order_by(TurnTask.year.desc())]
+    buildings = [b for (b,) in (db.session.query(TurnTask.building).distinct()
+                                .filter(TurnTask.year == year, TurnTask.building != None)
+                                .order_by(TurnTask.building))]
+    with turn_options_lock:
+        turn_options_cache[year] = (available_years, buildings)
+    return available_years, buildings
+
+def clear_turn_options_cache(*args):
+    with turn_options_lock:
+        turn_options_cache.clear()
+
+event.listen(TurnTask, 'after_insert', clear_turn_options_cache)
+event.listen(TurnTask, 'after_delete', clear_turn_options_cache)
 
 @app.route('/turn', methods=['GET'])
 @login_required
+@conditional_get('turn_task')
 def turn():
     year = request.args.get('year', datetime.today().year, type=int)
+    year = min(max(year, date.min.year), date.max.year)
     building = request.args.get('building', '')
     floor = request.args.get('floor', type=int)
 
@@ -580,8 +1368,7 @@ def turn():
         grouped_tasks[task.unit_number].append(task)
 
     # Dropdown options
-    available_years = sorted({task.year for task in TurnTask.query.all()}, reverse=True)
-    buildings = sorted({task.building for task in TurnTask.query.filter_by(year=year).all()})
+    available_years, buildings = turn_filter_options(year)
 
     return render_template("turn.html",
         tasks=tasks,
@@ -617,33 +1404,182 @@ def uncomplete_turn_task(task_id):
         db.session.commit()
     return redirect(url_for('turn', year=task.year))
 
+# Complete or reopen many turn tasks with one UPDATE; returns JSON so turn.html
+# can update in place. Body: {"completed": true, "task_ids": [1, 2]} or
+# {"completed": true, "year": 2025, "building": "A", "unit_number": "A-101"} for
+# a whole unit. turn.html sends the ids of the checkboxes it is showing.
+@app.route('/turn/tasks/complete', methods=['POST'])
+@login_required
+def complete_turn_tasks():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    completed = payload.get('completed', True)
+    if not isinstance(completed, bool):
+        return jsonify({'success': False, 'error': 'completed must be true or false'}), 400
+    task_ids = payload.get('task_ids')
+    if task_ids is not None:
+        if not isinstance(task_ids, list) or not task_ids or not all(is_db_int(i) for i in task_ids):
+            return jsonify({'success': False, 'error': 'task_ids must be a non-empty list of integers'}), 400
+        target = TurnTask.id.in_(task_ids)
+    elif is_db_int(payload.get('year')) and payload.get('building') and payload.get('unit_number'):
+        target = and_(TurnTask.year == payload['year'], TurnTask.building == str(payload['building']),
+                      TurnTask.unit_number == str(payload['unit_number']))
+    else:
+        return jsonify({'success': False, 'error': 'Give task_ids, or year, building and unit_number'}), 400
+
+    # Only touch rows whose state actually changes, so completed_by/at are kept.
+    if completed:
+        values = {'is_completed': True, 'completed_by': current_user.username, 'completed_at': datetime.utcnow()}
+        pending = or_(TurnTask.is_completed == False, TurnTask.is_completed == None)
+    else:
+        values = {'is_completed': False, 'completed_by': None, 'completed_at': None}
+        pending = TurnTask.is_completed == True
+    result = db.session.execute(update(TurnTask)
+                                .where(target, pending)
+                                .values(**values)
+                                .execution_options(synchronize_session=False))
+    db.session.commit()
+    completed_at = values['completed_at']
+    return jsonify({
+        'success': True,
+        'updated': result.rowcount,
+        'completed': completed,
+        'completed_by': values['completed_by'],
+        'completed_at': completed_at.strftime('%Y-%m-%d %H:%M') if completed_at else None,
+    })
+
 @app.route('/turn/setup', methods=['POST'])
 @login_required
-def setup_turn_2025():
+def setup_turn():
     if current_user.role != 'warden':
         abort(403)
 
-    existing = TurnTask.query.filter_by(year=2025).first()
-    if existing:
-        flash("Turn tasks for 2025 already exist.", "warning")
-        return redirect(url_for('turn'))
-
-    # Include the apartment layout and task seeding logic here...
-
+    year = request.form.get('year', datetime.today().year, type=int)
+    try:
+        layout = load_layout(app.config['TURN_LAYOUT_PATH'])
+    except ValueError as e:
+        flash(f"Turn setup failed. {e}", "danger")
+        return redirect(url_for('turn', year=year))
+    added = seed_turn_tasks(db.session, TurnTask, year, layout)
     db.session.commit()
-    flash("Turn setup for 2025 completed successfully!", "success")
-    return redirect(url_for('turn'))
+    # Bulk inserts skip the mapper events that normally clear this.
+    clear_turn_options_cache()
+    if added:
+        flash(f"Turn setup for {year} completed successfully! Added {added} tasks.", "success")
+    else:
+        flash(f"Turn tasks for {year} already exist.", "warning")
+    return redirect(url_for('turn', year=year))
+
+def log_filters_arg():
+    return {
+        'user': request.args.get('user', ''),
+        'entity': request.args.get('entity', ''),
+        'action': request.args.get('action', ''),
+        'start': request.args.get('start', ''),
+        'end': request.args.get('end', ''),
+    }
+
+def filter_logs(query, filters):
+    # Raises ValueError for a malformed start/end date.
+    if filters['user']:
+        query = query.filter(ActionLog.user_id.in_(select(User.id).where(User.username == filters['user'])))
+    if filters['entity']:
+        query = query.filter(ActionLog.entity == filters['entity'])
+    if filters['action']:
+        query = query.filter(ActionLog.action == filters['action'])
+    if filters['start']:
+        query = query.filter(ActionLog.timestamp >= datetime.strptime(filters['start'], "%Y-%m-%d"))
+    if filters['end']:
+        # No bound at all for an end of 9999-12-31.
+        end = day_after(parse_day(filters['end']))
+        if end is not None:
+            query = query.filter(ActionLog.timestamp < datetime.combine(end, datetime.min.time()))
+    return query
 
 @app.route('/warden/logs')
 @login_required
 def view_logs():
     if current_user.role != "warden":
         abort(403)
-    logs = ActionLog.query.order_by(ActionLog.timestamp.desc()).all()
-    return render_template("warden_logs.html", logs=logs)
+    filters = log_filters_arg()
+    per_page = page_size_arg('LOGS_PAGE_SIZE', 'LOGS_MAX_PAGE_SIZE')
+    after = request.args.get('after', '')
+
+    query = ActionLog.query.options(joinedload(ActionLog.user))
+    try:
+        query = filter_logs(query, filters)
+    except ValueError:
+        flash("Invalid date range.", "danger")
+        query = filter_logs(ActionLog.query.options(joinedload(ActionLog.user)), dict(filters, start='', end=''))
+
+    cursor = decode_cursor(after, (str, type(None)), int)
+    if cursor:
+        try:
+            timestamp = datetime.fromisoformat(cursor[0]) if cursor[0] else None
+            query = query.filter(keyset_after(ActionLog.timestamp, ActionLog.id, (timestamp, cursor[1]),
+                                              descending=True))
+        except ValueError:
+            pass
+    logs = query.order_by(ActionLog.timestamp.desc(), ActionLog.id.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(logs) > per_page:
+        logs = logs[:per_page]
+        last = logs[-1]
+        next_cursor = encode_cursor(last.timestamp.isoformat() if last.timestamp else None, last.id)
+
+    usernames = [name for (name,) in db.session.query(User.username).order_by(User.username)]
+    return render_template("warden_logs.html", logs=logs, filters=filters, usernames=usernames,
+                           per_page=per_page, after=after, next_cursor=next_cursor)
+
+
+# Full audit export, oldest first, with the same filters as the log viewer.
+@app.route('/warden/logs/export.<any(csv, jsonl):fmt>')
+@login_required
+def export_logs(fmt):
+    if current_user.role != "warden":
+        abort(403)
+    columns = ['id', 'timestamp', 'username', 'action', 'entity', 'entity_id', 'details']
+    stmt = (select(ActionLog.id, ActionLog.timestamp, User.username, ActionLog.action, ActionLog.entity,
+                   ActionLog.entity_id, ActionLog.details)
+            .outerjoin(User, ActionLog.user_id == User.id)
+            .order_by(ActionLog.timestamp, ActionLog.id))
+    try:
+        stmt = filter_logs(stmt, log_filters_arg())
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Dates must be YYYY-MM-DD'}), 400
+    return export_response('action_log', fmt, columns, stmt)
 
 
 
+# Request metrics: HTML for wardens, Prometheus text for scrapers.
+@app.route('/warden/metrics')
+@login_required
+def warden_metrics():
+    if current_user.role != "warden":
+        abort(403)
+    snapshot = request_metrics.snapshot()
+    endpoints = sorted(snapshot, key=lambda name: snapshot[name]['duration'].total, reverse=True)
+    return render_template("warden_metrics.html", snapshot=snapshot, endpoints=endpoints,
+                           sample_rate=request_metrics.sample_rate, user_cache=user_cache_info())
+
+@app.route('/warden/metrics/reset', methods=['POST'])
+@login_required
+def reset_metrics():
+    if current_user.role != "warden":
+        abort(403)
+    request_metrics.reset()
+    flash("Metrics reset.", "success")
+    return redirect(url_for('warden_metrics'))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    token = app.config['METRICS_TOKEN']
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not (current_user.is_authenticated and current_user.role == "warden"):
+        abort(403)
+    return Response(request_metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
 #Error handling stuff
 @app.route('/order/error')
 def order_error():
@@ -665,8 +1601,10 @@ def not_found_error(error):
 
 @app.errorhandler(Exception)
 def generic_error(error):
-    import traceback
-    traceback.print_exc()  # ⬅️ THIS will print the error
+    # abort(403) and friends keep their status; only real failures are logged.
+    if isinstance(error, HTTPException):
+        return error
+    app.logger.exception("Unhandled error on %s %s", request.method, request.path)
     return render_template("error.html", error_code=500, error_message="An unexpected error occurred."), 500
 
 
@@ -0,0 +1,95 @@
+### Buffered audit log writer ###
+# Collects ActionLog rows from request threads and inserts them in batches on
+# a background thread, so mutation routes don't pay for a second commit.
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedAuditWriter:
+    def __init__(self, get_engine, table, max_batch=200, max_delay=2.0):
+        self.get_engine = get_engine
+        self.table = table
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._flush_now = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+        # Anything still buffered when the process exits gets written.
+        atexit.register(self.close)
+
+    def write(self, rows):
+        for row in rows:
+            self._queue.put(row)
+
+    def flush(self):
+        # Block until every row queued so far has been written.
+        if not self._thread.is_alive():
+            self._drain()
+            return
+        self._flush_now.set()
+        try:
+            self._queue.join()
+        finally:
+            self._flush_now.clear()
+
+    def close(self):
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout=self.max_delay + 5)
+        self._drain()
+
+    def _run(self):
+        # Flush when a batch fills up or max_delay passes since its first row.
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                if self._stopping.is_set() or self._flush_now.is_set():
+                    # Take whatever is already queued without waiting for more.
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.1)))
+                except queue.Empty:
+                    continue
+            self._write_batch(batch)
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.max_batch:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        try:
+            with self.get_engine().begin() as conn:
+                conn.execute(self.table.insert(), batch)
+        except Exception:
+            logger.exception("Failed to write %d audit log rows", len(batch))
+        finally:
+            for _ in batch:
+                self._queue.task_done()
@@ -0,0 +1,126 @@
+### Multi-process SQLite benchmark ###
+# Runs writer processes hammering /api/increment and /api/decrement alongside
+# reader processes polling /api/alerts, the way several gunicorn workers share
+# one SQLite file, and compares SQLite's default settings with the
+# SQLITE_PRAGMAS profile in app.py.
+#
+#   python bench_concurrency.py --writers 4 --readers 4 --duration 10
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+PROFILES = ('default', 'tuned')
+
+
+def load_app(db_path, profile):
+    # app reads DATABASE_URL at import time, so this only works in a fresh process.
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['MAIL_WORKER'] = '0'
+    import app as inventory
+    if profile == 'default':
+        inventory.app.config['SQLITE_PRAGMAS'] = {}
+    return inventory
+
+
+def setup(db_path, profile, parts):
+    inventory = load_app(db_path, profile)
+    with inventory.app.app_context():
+        inventory.db.create_all()
+        user = inventory.User(username='bench', role='technician')
+        user.set_password('bench')
+        inventory.db.session.add(user)
+        inventory.db.session.add_all(
+            inventory.Part(name=f'Part {i}', model_number=f'BENCH{i:05d}', count=100, cost=1.0,
+                           room='Other', threshold=5)
+            for i in range(parts))
+        inventory.db.session.commit()
+
+
+def worker(db_path, profile, role, parts, ready, duration, results):
+    inventory = load_app(db_path, profile)
+    client = inventory.app.test_client()
+    with inventory.app.app_context():
+        user_id = inventory.User.query.filter_by(username='bench').one().id
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+    latencies, errors = [], 0
+    # Start the clock only once every process has imported the app.
+    ready.wait()
+    deadline = time.time() + duration
+    step = 0
+    while time.time() < deadline:
+        if role == 'writer':
+            action = 'increment' if step % 2 == 0 else 'decrement'
+            url = f'/api/{action}/{random.randint(1, parts)}'
+            started = time.perf_counter()
+            response = client.post(url)
+        else:
+            started = time.perf_counter()
+            response = client.get('/api/alerts')
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            errors += 1
+        step += 1
+    results.put((role, latencies, errors))
+
+
+def run_profile(profile, args):
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        setup_proc = ctx.Process(target=setup, args=(db_path, profile, args.parts))
+        setup_proc.start()
+        setup_proc.join()
+        results = ctx.Queue()
+        roles = ['writer'] * args.writers + ['reader'] * args.readers
+        ready = ctx.Barrier(len(roles))
+        procs = [ctx.Process(target=worker,
+                             args=(db_path, profile, role, args.parts, ready, args.duration, results))
+                 for role in roles]
+        for proc in procs:
+            proc.start()
+        collected = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    summary = {}
+    for role in ('writer', 'reader'):
+        latencies = [l for r, lat, _ in collected if r == role for l in lat]
+        errors = sum(e for r, _, e in collected if r == role)
+        if not latencies:
+            continue
+        cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        summary[role] = {
+            'requests': len(latencies),
+            'per_second': len(latencies) / args.duration,
+            'errors': errors,
+            'p50_ms': cuts[49] * 1000,
+            'p95_ms': cuts[94] * 1000,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent read/write benchmark against a SQLite file")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per profile")
+    parser.add_argument('--parts', type=int, default=200)
+    parser.add_argument('--profile', choices=PROFILES + ('both',), default='both')
+    args = parser.parse_args()
+
+    profiles = PROFILES if args.profile == 'both' else (args.profile,)
+    print(f"{args.writers} writers, {args.readers} readers, {args.duration:g}s per profile")
+    print(f"{'profile':<8} {'role':<7} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for profile in profiles:
+        for role, row in run_profile(profile, args).items():
+            print(f"{profile:<8} {role:<7} {row['requests']:>9} {row['per_second']:>9.1f} {row['errors']:>7} "
+                  f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+### Route benchmark suite ###
+# Seeds a SQLite file with production-sized synthetic data, times every main
+# page through app.test_client() and compares the medians with a saved
+# baseline. Runs offline: the budget sheet is served from a StaticSheetClient.
+#
+#   python bench_routes.py --scale 0.05              # quick run against 5% of the data
+#   python bench_routes.py --save-baseline           # record bench_baseline.json
+#   python bench_routes.py --threshold 0.25          # exit 1 if a route got >25% slower
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# Row counts at --scale 1.
+FULL_SIZE = {"parts": 20_000, "orders": 1_000_000, "logs": 500_000, "turn_tasks": 10_000}
+EXPENSE_LINES = ["Appliances", "HVAC", "Mechanical", "Pools & Exterior", "Interior Unit Work",
+                 "Fire & Safety", "Janitorial"]
+SHEET = [
+    ["Line", "JAN", "FEB", "MARCH", "APRIL", "MAY", "JUNE", "JULY", "AUGUST", "SEPT", "OCT", "NOV", "DEC"],
+    ["Appliance Parts"] + ["1000"] * 12,
+    ["HVAC Parts"] + ["500"] * 12,
+    ["Janitorial Supplies"] + ["250"] * 12,
+]
+# Synthetic property the turn_task rows are generated from.
+TURN_LAYOUT = {
+    "tasks": ["Paint", "Carpet Clean", "Deep Clean", "Replace Filter", "Final Inspection"],
+    "buildings": [{"name": name, "sides": ["East", "West"], "floors": 5, "units_per_side": 10}
+                  for name in "ABCD"],
+}
+CHUNK = 10_000
+
+
+def routes(year):
+    return [
+        ("index", "/"),
+        ("index_search", "/?search=filter"),
+        ("index_room", "/?room=Kitchen&appliance=Oven"),
+        ("alerts", "/api/alerts"),
+        ("combined", "/combined"),
+        ("history", f"/history?year={year}"),
+        ("history_month", f"/history?year={year}&month=3"),
+        ("budget", "/budget?q=1"),
+        ("trends", "/trends"),
+        ("turn", f"/turn?year={year}&building=A"),
+        ("warden_logs", "/warden/logs"),
+        ("warden_logs_filtered", "/warden/logs?entity=Part&action=update"),
+    ]
+
+
+def load_app(db_path):
+    # app reads DATABASE_URL at import time.
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["MAIL_WORKER"] = "0"
+    import app as inventory
+    from budget_sheet import StaticSheetClient
+    inventory.app.config["BUDGET_REFRESH_INTERVAL"] = 0
+    inventory.budget_sheet.client = StaticSheetClient(SHEET)
+    inventory.budget_sheet.snapshot_path = os.path.join(os.path.dirname(db_path), "bench_budget_snapshot.json")
+    return inventory
+
+
+def chunked(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(inventory, sizes, rng, year):
+    from sqlalchemy import insert, text
+    from turn_seed import build_turn_rows
+    db = inventory.db
+    db.drop_all()
+    db.create_all()
+    started = time.perf_counter()
+
+    users = []
+    for i in range(20):
+        user = inventory.User(username=f"user{i}", role="warden" if i == 0 else "technician")
+        user.set_password("bench")
+        users.append(user)
+    db.session.add_all(users)
+    db.session.commit()
+
+    # Rooms and appliances come from the app so the data matches its filters.
+    rooms = inventory.ROOMS
+
+    def parts():
+        for i in range(sizes["parts"]):
+            room = rng.choice(list(rooms))
+            count = rng.randint(0, 40)
+            yield {
+                "name": f"{rng.choice(['Filter', 'Valve', 'Hinge', 'Element', 'Switch'])} {i}",
+                "model_number": f"BM{i:07d}",
+                "count": count,
+                "cost": round(rng.uniform(1, 400), 2),
+                "room": room,
+                "appliance_type": rng.choice(rooms[room]),
+                "threshold": 5,
+                "is_misc": False,
+                "order_status": "Not Ordered",
+                "order_link": "https://example.com/part" if i % 3 else None,
+            }
+
+    def orders():
+        start = date(year - 4, 1, 1)
+        span = (date(year, 12, 31) - start).days
+        for _ in range(sizes["orders"]):
+            ordered = start + timedelta(days=rng.randint(0, span))
+            delivered = ordered + timedelta(days=rng.randint(1, 14)) if rng.random() > 0.02 else None
+            yield {
+                "part_id": rng.randint(1, sizes["parts"]),
+                "order_date": ordered,
+                "purchased_quantity": rng.randint(1, 10),
+                "total_cost": round(rng.uniform(5, 900), 2),
+                "tracking_number": f"1Z{rng.randint(0, 10**9):09d}",
+                "delivered_date": delivered,
+                "expense_line": rng.choice(EXPENSE_LINES),
+            }
+
+    def logs():
+        start = datetime(year - 2, 1, 1)
+        for _ in range(sizes["logs"]):
+            yield {
+                "user_id": rng.randint(1, len(users)),
+                "action": rng.choice(["add", "update", "delete", "increment", "decrement"]),
+                "entity": "Part",
+                "entity_id": rng.randint(1, sizes["parts"]),
+                "timestamp": start + timedelta(seconds=rng.randint(0, 3 * 365 * 86400)),
+                "details": "Count changed",
+            }
+
+    def turn_tasks():
+        per_year = sum(1 for _ in build_turn_rows(year, TURN_LAYOUT, TURN_LAYOUT["tasks"]))
+        years = max(1, math.ceil(sizes["turn_tasks"] / per_year))
+        rows = (row for y in range(year - years + 1, year + 1)
+                for row in build_turn_rows(y, TURN_LAYOUT, TURN_LAYOUT["tasks"]))
+        for i, row in enumerate(rows):
+            if i >= sizes["turn_tasks"]:
+                return
+            row["is_completed"] = rng.random() < 0.4
+            yield row
+
+    for model, rows in ((inventory.Part, parts()), (inventory.OrderHistory, orders()),
+                        (inventory.ActionLog, logs()), (inventory.TurnTask, turn_tasks())):
+        for chunk in chunked(rows):
+            db.session.execute(insert(model), chunk)
+        db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+    print(f"Seeded {sizes} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+def time_routes(inventory, year, repeat):
+    client = inventory.app.test_client()
+    with inventory.app.app_context():
+        warden_id = inventory.User.query.filter_by(username="user0").one().id
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(warden_id)
+        sess["_fresh"] = True
+    results = {}
+    for name, url in routes(year):
+        response = client.get(url)  # warm-up: caches, templates, SQLite page cache
+        if response.status_code != 200:
+            raise SystemExit(f"{url} returned {response.status_code}")
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            client.get(url).close()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = {"url": url, "median_ms": statistics.median(samples), "max_ms": max(samples)}
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"{'route':<22} {'median ms':>10} {'baseline':>10} {'change':>8}")
+    for name, row in results.items():
+        base = baseline.get(name, {}).get("median_ms")
+        change = ""
+        if base:
+            ratio = row["median_ms"] / base - 1
+            change = f"{ratio:+.0%}"
+            if ratio > threshold:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<22} {row['median_ms']:>10.1f} {base or float('nan'):>10.1f} {change:>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every main route against seeded synthetic data")
+    parser.add_argument("--db", help="SQLite file to use; seeded on first use (default: a temp file)")
+    parser.add_argument("--reseed", action="store_true", help="Regenerate the data even if --db exists")
+    parser.add_argument("--scale", type=float, default=1.0, help="Fraction of the full data set to generate")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the data generator")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed requests per route")
+    parser.add_argument("--baseline", default="bench_baseline.json", help="Baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run's timings as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before a route is flagged")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db:
+        db_path = os.path.abspath(args.db)
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmpdir.name, "bench.db")
+    needs_seed = args.reseed or not os.path.exists(db_path)
+    inventory = load_app(db_path)
+    year = date.today().year
+    sizes = {key: max(1, int(count * args.scale)) for key, count in FULL_SIZE.items()}
+    with inventory.app.app_context():
+        if needs_seed:
+            seed(inventory, sizes, random.Random(args.seed), year)
+    results = time_routes(inventory, year, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("scale") == args.scale:
+            baseline = saved.get("routes", {})
+        else:
+            print(f"{args.baseline} was recorded at --scale {saved.get('scale')}; not comparing", file=sys.stderr)
+    regressions = compare(results, baseline, args.threshold)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                       "routes": results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}", file=sys.stderr)
+    if regressions and not args.save_baseline:
+        print(f"Slower than baseline by more than {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+### Budget spreadsheet snapshot ###
+# /budget reads the quarterly budget from a Google Sheet. Fetching it costs one
+# to three seconds, so the page serves a locally persisted snapshot instead and
+# a background thread keeps that snapshot fresh.
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SHEET_SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+class GoogleSheetClient:
+    def __init__(self, sheet_key, credentials_file=None):
+        self.sheet_key = sheet_key
+        if credentials_file is None:
+            # Production hosts are EC2 boxes ("ip-..."); anything else is dev.
+            credentials_file = "credentials.json" if "ip-" in socket.gethostname() else "dev_credentials.json"
+        self.credentials_file = credentials_file
+
+    def fetch_values(self):
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+        creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, SHEET_SCOPE)
+        client = gspread.authorize(creds)
+        return client.open_by_key(self.sheet_key).sheet1.get_all_values()
+
+
+# Local stand-in for tests, benchmarks and offline development.
+class StaticSheetClient:
+    def __init__(self, values):
+        self.values = values
+        self.fetches = 0
+
+    def fetch_values(self):
+        self.fetches += 1
+        return [list(row) for row in self.values]
+
+
+class BudgetSheetCache:
+    def __init__(self, client, snapshot_path, ttl=300):
+        self.client = client
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self._values = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._refresher = None
+
+    def get_values(self):
+        # Returns (values, fetched_at). Only blocks on the sheet when there is no
+        # snapshot at all; a stale snapshot is served while a refresh runs.
+        with self._lock:
+            values, fetched_at = self._values, self._fetched_at
+        if values is None or self._is_stale(fetched_at):
+            # Another worker may have refreshed the shared snapshot already.
+            values, fetched_at = self.load_snapshot() or (values, fetched_at)
+        if values is None:
+            self.refresh()
+            with self._lock:
+                return self._values, self._fetched_at
+        if self._is_stale(fetched_at):
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return values, fetched_at
+
+    def refresh(self):
+        # Pull the sheet and persist it. Keeps the last good snapshot on failure.
+        if not self._refreshing.acquire(blocking=False):
+            return False
+        try:
+            try:
+                values = self.client.fetch_values()
+            except Exception:
+                logger.exception("Budget sheet refresh failed")
+                return False
+            fetched_at = time.time()
+            with self._lock:
+                self._values, self._fetched_at = values, fetched_at
+            self._save_snapshot(values, fetched_at)
+            return True
+        finally:
+            self._refreshing.release()
+
+    def load_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+        values, fetched_at = snapshot.get("values"), snapshot.get("fetched_at")
+        if not isinstance(values, list) or fetched_at is None:
+            return None
+        with self._lock:
+            if self._fetched_at is None or fetched_at > self._fetched_at:
+                self._values, self._fetched_at = values, fetched_at
+            return self._values, self._fetched_at
+
+    def start_refresher(self, interval):
+        # Idempotent; safe to call on every request.
+        if self._refresher is not None or not interval:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, args=(interval,), daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+    def _is_stale(self, fetched_at):
+        return fetched_at is None or time.time() - fetched_at > self.ttl
+
+    def _save_snapshot(self, values, fetched_at):
+        # Write to a temp file and rename so readers never see half a snapshot.
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": fetched_at, "values": values}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            logger.exception("Could not save budget snapshot to %s", self.snapshot_path)
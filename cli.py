@@ -1,16 +1,22 @@
 import argparse
+import sys
+import time
 from datetime import datetime, timedelta, timezone
-from app import app, db, Part, Expense  
+from sqlalchemy.exc import IntegrityError
+from app import app, db, Part, OrderHistory, TurnTask, clear_turn_options_cache
+from turn_seed import seed_turn_tasks, load_layout
+from parts_io import FORMATS, detect_format, open_file, read_parts, upsert_parts, export_parts
 
 def list_parts():
     with app.app_context():
-        parts = Part.query.all()
-        if not parts:
-            print("No parts found.")
-            return
+        parts = Part.query.order_by(Part.id).yield_per(1000)
+        found = False
         for p in parts:
+            found = True
             print(f"ID: {p.id} | Name: {p.name} | Model: {p.model_number} | Count: {p.count} | "
                   f"Cost: {p.cost} | Room: {p.room} | Threshold: {p.threshold} | Misc: {p.is_misc}")
+        if not found:
+            print("No parts found.")
 
 def add_part(args):
     with app.app_context():
@@ -62,20 +68,60 @@ def delete_part(args):
 
 def list_expenses():
     with app.app_context():
-        six_months_ago = datetime.now(timezone.utc) - timedelta(days=180)
-        expenses = Expense.query.filter(Expense.expense_date >= six_months_ago).all()
-        if not expenses:
+        six_months_ago = datetime.now(timezone.utc).date() - timedelta(days=180)
+        orders = OrderHistory.query.filter(OrderHistory.delivered_date >= six_months_ago).all()
+        if not orders:
             print("No expenses found in the last six months.")
             return
-        for e in expenses:
-            print(f"ID: {e.id} | Part ID: {e.part_id} | Date: {e.expense_date:%Y-%m-%d} | Amount: {e.amount}")
+        for o in orders:
+            print(f"ID: {o.id} | Part ID: {o.part_id} | Date: {o.delivered_date:%Y-%m-%d} | Amount: {o.total_cost}")
 
-def add_expense(args):
+def seed_turn(args):
     with app.app_context():
-        expense = Expense(part_id=args.part_id, amount=args.amount)
-        db.session.add(expense)
+        try:
+            layout = load_layout(args.layout or app.config['TURN_LAYOUT_PATH'])
+        except ValueError as e:
+            sys.exit(str(e))
+        start = time.perf_counter()
+        added = seed_turn_tasks(db.session, TurnTask, args.year, layout)
         db.session.commit()
-        print(f"Added expense for part ID: {expense.part_id}, amount: {expense.amount}")
+        clear_turn_options_cache()
+        print(f"Added {added} turn tasks for {args.year} in {time.perf_counter() - start:.2f}s")
+
+def import_parts(args):
+    try:
+        fmt = detect_format(args.file, args.format)
+    except ValueError as e:
+        sys.exit(str(e))
+    with app.app_context():
+        start = time.perf_counter()
+
+        def report(inserted, updated):
+            done = inserted + updated
+            print(f"  {done} rows ({done / (time.perf_counter() - start):.0f} rows/s)", file=sys.stderr)
+
+        with open_file(args.file, "r") as fp:
+            try:
+                inserted, updated = upsert_parts(db.session, Part, read_parts(fp, fmt),
+                                                 batch_size=args.batch_size, on_batch=report)
+            except (ValueError, IntegrityError) as e:
+                db.session.rollback()
+                sys.exit(f"Import stopped at {args.file}, {e} (earlier batches were saved)")
+        elapsed = time.perf_counter() - start
+        print(f"Imported {inserted + updated} parts ({inserted} new, {updated} updated) in {elapsed:.2f}s "
+              f"({(inserted + updated) / elapsed:.0f} rows/s)", file=sys.stderr)
+
+def export_parts_cmd(args):
+    try:
+        fmt = detect_format(args.file, args.format)
+    except ValueError as e:
+        sys.exit(str(e))
+    with app.app_context():
+        start = time.perf_counter()
+        with open_file(args.file, "w") as fp:
+            written = export_parts(db.session, Part, fp, fmt, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"Exported {written} parts in {elapsed:.2f}s ({written / elapsed:.0f} rows/s)", file=sys.stderr)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Maintenance Inventory System CLI")
@@ -112,10 +158,20 @@ if __name__ == '__main__':
     # List expenses command
     subparsers.add_parser("expenses", help="List expenses from the last six months")
     
-    # Add expense command
-    parser_expense = subparsers.add_parser("add_expense", help="Add an expense record")
-    parser_expense.add_argument("--part_id", type=int, required=True, help="ID of the part")
-    parser_expense.add_argument("--amount", type=float, required=True, help="Expense amount")
+    # Seed turn tasks command
+    parser_seed = subparsers.add_parser("seed-turn", help="Create the turn checklist for a year (safe to re-run)")
+    parser_seed.add_argument("--year", type=int, default=datetime.now().year, help="Turn year")
+    parser_seed.add_argument("--layout", help="JSON file with the buildings layout and task list (default: TURN_LAYOUT_PATH)")
+    
+    # Bulk import/export commands
+    parser_import = subparsers.add_parser("import", help="Add or update parts from CSV/JSONL, matched by model_number")
+    parser_import.add_argument("file", help="CSV or JSONL file ('-' for stdin)")
+    parser_import.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    parser_import.add_argument("--batch-size", type=int, default=1000, help="Rows per transaction")
+    parser_export = subparsers.add_parser("export", help="Write all parts as CSV/JSONL")
+    parser_export.add_argument("file", help="CSV or JSONL file ('-' for stdout)")
+    parser_export.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    parser_export.add_argument("--batch-size", type=int, default=1000, help="Rows fetched at a time")
     
     args = parser.parse_args()
     
@@ -129,7 +185,11 @@ if __name__ == '__main__':
         delete_part(args)
     elif args.command == "expenses":
         list_expenses()
-    elif args.command == "add_expense":
-        add_expense(args)
+    elif args.command == "seed-turn":
+        seed_turn(args)
+    elif args.command == "import":
+        import_parts(args)
+    elif args.command == "export":
+        export_parts_cmd(args)
     else:
         parser.print_help()
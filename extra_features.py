@@ -1,7 +1,5 @@
 ### Extra imports for email features ###
 import uuid
-import smtplib
-from email.mime.text import MIMEText
 from flask import url_for
 
 ### Email Features ###
@@ -22,20 +20,9 @@ def send_email_verification(user):
     If you did not request this, please ignore this message.
     """
 
-    msg = MIMEText(body)
-    msg['Subject'] = subject
-    msg['From'] = "villageinventorysystem@gmail.com"
-    msg['To'] = user.email
-
-    try:
-        smtp_server = smtplib.SMTP('smtp.gmail.com', 587)
-        smtp_server.starttls()
-        smtp_server.login('villageinventorysystem@gmail.com', 'aqrpnrgupkvrizls')  # <== your app password
-        smtp_server.sendmail(msg['From'], [msg['To']], msg.as_string())
-        smtp_server.quit()
-        print(f"✅ Verification email sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send verification email: {e}")
+    # Sent by the mail worker; the settings page doesn't wait on SMTP.
+    queue_email(user.email, subject, body)
+    db.session.commit()
 
 def send_password_reset_email(user):
     reset_link = url_for('reset_password', token=user.reset_token, _external=True)
@@ -49,20 +36,8 @@ def send_password_reset_email(user):
 
     If you didn't request a password reset, just ignore this email.
     """
-    msg = MIMEText(body)
-    msg['Subject'] = subject
-    msg['From'] = "The Village IMS <villageinventorysystem@gmail.com>"
-    msg['To'] = user.email
-
-    try:
-        smtp_server = smtplib.SMTP('smtp.gmail.com', 587)
-        smtp_server.starttls()
-        smtp_server.login('villageinventorysystem@gmail.com', 'your-app-password-here')
-        smtp_server.sendmail(msg['From'], [msg['To']], msg.as_string())
-        smtp_server.quit()
-        print(f"✅ Password reset email sent to {user.email}")
-    except Exception as e:
-        print(f"❌ Failed to send password reset email: {e}")
+    queue_email(user.email, subject, body)
+    db.session.commit()
 
 
 ### Settings Route ###
@@ -71,6 +46,9 @@ def send_password_reset_email(user):
 @app.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
+    # current_user is a cached, read-only record; changes go through the User row.
+    # Committing them drops the cache entry.
+    user = db.session.get(User, current_user.id)
     if request.method == 'POST':
         action = request.form.get('action')
 
@@ -78,14 +56,14 @@ def settings():
             new_email = request.form.get('email', '').strip()
             if not new_email:
                 flash("Email cannot be empty.", "danger")
-            elif User.query.filter(User.email == new_email, User.id != current_user.id).first():
+            elif User.query.filter(User.email == new_email, User.id != user.id).first():
                 flash("Email is already in use.", "danger")
             else:
-                current_user.email = new_email
-                current_user.is_verified = False
-                current_user.verification_token = str(uuid.uuid4())
+                user.email = new_email
+                user.is_verified = False
+                user.verification_token = str(uuid.uuid4())
                 db.session.commit()
-                send_email_verification(current_user)
+                send_email_verification(user)
                 flash("Email updated. Please check your inbox to verify.", "success")
 
         elif action == 'change_password':
@@ -93,18 +71,18 @@ def settings():
             new_password = request.form.get('new_password')
             confirm_password = request.form.get('confirm_password')
 
-            if not current_user.check_password(current_password):
+            if not user.check_password(current_password):
                 flash("Current password is incorrect.", "danger")
             elif new_password != confirm_password:
                 flash("New passwords do not match.", "danger")
             elif len(new_password) < 6:
                 flash("Password must be at least 6 characters long.", "danger")
             else:
-                current_user.set_password(new_password)
+                user.set_password(new_password)
                 db.session.commit()
                 flash("Password updated successfully.", "success")
 
-    return render_template("settings.html", user=current_user)
+    return render_template("settings.html", user=user)
 
 
 @app.route('/forgot-password', methods=['GET', 'POST'])
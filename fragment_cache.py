@@ -0,0 +1,117 @@
+### Rendered HTML fragment cache ###
+# Holds rendered template fragments under a key the caller builds from
+# everything the fragment depends on, including a data version, so a change to
+# the data simply moves readers to new keys and the old entries age out.
+# Backends: MemoryBackend (per process) and DiskBackend, a SQLite file that
+# every gunicorn worker on the host reads and fills.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from cachetools import LRUCache
+
+
+class MemoryBackend:
+    def __init__(self, maxsize):
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskBackend:
+    # Least recently used entries beyond maxsize are deleted on every write.
+    # Recency is approximate: a hit only records its time when the stored one
+    # is over touch_interval seconds old, so most reads never write to the
+    # shared file.
+    def __init__(self, path, maxsize, touch_interval=60):
+        self.path = path
+        self.maxsize = maxsize
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")  # a lost entry is just a miss
+            conn.execute("CREATE TABLE IF NOT EXISTS fragment "
+                         "(key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_fragment_used ON fragment (used)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute("SELECT value, used FROM fragment WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] >= self.touch_interval:
+            conn.execute("UPDATE fragment SET used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO fragment (key, value, used) VALUES (?, ?, ?)",
+                         (key, value, time.time()))
+            conn.execute("DELETE FROM fragment WHERE key IN "
+                         "(SELECT key FROM fragment ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.maxsize,))
+
+    def clear(self):
+        self._connection().execute("DELETE FROM fragment")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM fragment").fetchone()[0]
+
+
+class FragmentCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(parts):
+        # parts is any JSON-serialisable sequence.
+        return hashlib.sha1(json.dumps(list(parts)).encode()).hexdigest()
+
+    def get(self, parts):
+        value = self.backend.get(self.make_key(parts))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, parts, value):
+        self.backend.set(self.make_key(parts), value)
+
+    def clear(self):
+        self.backend.clear()
+
+    def info(self):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses}
+        return dict(stats, size=len(self.backend))
@@ -0,0 +1,154 @@
+### Outbound mail queue ###
+# Requests only insert a row into outbound_email; a worker thread sends due
+# rows in batches over one long-lived SMTP connection, retrying failures with
+# exponential backoff. Works across processes: rows are claimed with a
+# conditional UPDATE, and a claim that is never finished expires after
+# `lease` seconds so another worker picks the message up.
+import logging
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from sqlalchemy import select, update
+
+logger = logging.getLogger(__name__)
+
+
+def smtp_connection_factory(host, port, username=None, password=None, use_tls=True, timeout=30):
+    def connect():
+        smtp = smtplib.SMTP(host, port, timeout=timeout)
+        if use_tls:
+            smtp.starttls()
+        if username:
+            smtp.login(username, password)
+        return smtp
+    return connect
+
+
+def is_permanent(error):
+    # 5xx replies won't succeed on retry. SMTPRecipientsRefused has no
+    # smtp_code of its own; it carries one (code, message) per refused address.
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+    else:
+        codes = [getattr(error, 'smtp_code', 0)]
+    return bool(codes) and all(code >= 500 for code in codes)
+
+
+class MailWorker:
+    def __init__(self, get_engine, table, smtp_factory, batch_size=20, poll_interval=5.0,
+                 max_attempts=5, backoff=30, lease=600):
+        self.get_engine = get_engine
+        self.table = table
+        self.smtp_factory = smtp_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self._smtp = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mail-worker", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self):
+        # Send one batch of due messages; returns how many went out.
+        batch = self._claim_batch()
+        sent = 0
+        for row in batch:
+            if self._send(row):
+                sent += 1
+        if not batch:
+            self._disconnect()
+        return sent
+
+    def _run(self):
+        while True:
+            try:
+                # Keep going while full batches come back; otherwise wait.
+                if self.run_once() >= self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("Mail worker pass failed")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _claim_batch(self):
+        t = self.table
+        now = datetime.utcnow()
+        claimed = []
+        with self.get_engine().begin() as conn:
+            due = conn.execute(select(t.c.id)
+                               .where(t.c.status.in_(('pending', 'sending')), t.c.next_attempt_at <= now)
+                               .order_by(t.c.next_attempt_at, t.c.id)
+                               .limit(self.batch_size)).scalars().all()
+            for email_id in due:
+                # Only one worker wins each row.
+                result = conn.execute(update(t)
+                                      .where(t.c.id == email_id, t.c.status.in_(('pending', 'sending')),
+                                             t.c.next_attempt_at <= now)
+                                      .values(status='sending', next_attempt_at=now + timedelta(seconds=self.lease)))
+                if result.rowcount:
+                    claimed.append(email_id)
+            if not claimed:
+                return []
+            return conn.execute(select(t).where(t.c.id.in_(claimed)).order_by(t.c.id)).all()
+
+    def _send(self, row):
+        msg = MIMEText(row.body)
+        msg['Subject'] = row.subject
+        msg['From'] = row.from_address
+        msg['To'] = row.to_address
+        try:
+            try:
+                self._connection().sendmail(row.from_address, [row.to_address], msg.as_string())
+            except smtplib.SMTPServerDisconnected:
+                # The kept-alive connection went stale; reconnect once.
+                self._disconnect()
+                self._connection().sendmail(row.from_address, [row.to_address], msg.as_string())
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            self._finish(row, error=e, permanent=is_permanent(e))
+            return False
+        except (smtplib.SMTPException, OSError) as e:
+            self._disconnect()
+            self._finish(row, error=e)
+            return False
+        self._finish(row)
+        return True
+
+    def _finish(self, row, error=None, permanent=False):
+        now = datetime.utcnow()
+        if error is None:
+            values = {'status': 'sent', 'sent_at': now, 'attempts': row.attempts + 1, 'last_error': None}
+        else:
+            attempts = row.attempts + 1
+            give_up = permanent or attempts >= self.max_attempts
+            logger.warning("Sending email %s to %s failed (attempt %d): %s", row.id, row.to_address, attempts, error)
+            values = {
+                'status': 'failed' if give_up else 'pending',
+                'attempts': attempts,
+                'last_error': str(error),
+                'next_attempt_at': now + timedelta(seconds=self.backoff * 2 ** (attempts - 1)),
+            }
+        with self.get_engine().begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == row.id).values(**values))
+
+    def _connection(self):
+        if self._smtp is None:
+            self._smtp = self.smtp_factory()
+        return self._smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
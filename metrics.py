@@ -0,0 +1,142 @@
+### Per-request performance metrics ###
+# Records wall time, SQL statement count, SQL time and response size for a
+# sample of requests, per endpoint, into fixed-bucket histograms. Fed by Flask's
+# request signals and SQLAlchemy cursor events; read by /warden/metrics and the
+# Prometheus endpoint.
+import random
+import threading
+import time
+from flask import g, has_request_context, request, request_finished, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# (name, help, bucket upper bounds)
+SERIES = {
+    "duration": ("ims_request_duration_seconds", "Wall time per request",
+                 (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    "queries": ("ims_request_sql_queries", "SQL statements per request",
+                (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)),
+    "sql_duration": ("ims_request_sql_duration_seconds", "Time spent in SQL per request",
+                     (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    "response_size": ("ims_response_size_bytes", "Response body size",
+                      (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 10_000_000)),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation.
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class RequestMetrics:
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.enabled = True
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def snapshot(self):
+        # {endpoint: {series: Histogram}}, copied so callers can read it unlocked.
+        with self._lock:
+            return {endpoint: {key: self._copy(hist) for key, hist in series.items()}
+                    for endpoint, series in self._endpoints.items()}
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        for key, (name, help_text, _) in SERIES.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for endpoint in sorted(snapshot):
+                hist = snapshot[endpoint][key]
+                label = f'endpoint="{endpoint}"'
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {hist.count}')
+                lines.append(f"{name}_sum{{{label}}} {hist.total}")
+                lines.append(f"{name}_count{{{label}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def _request_started(self, sender, **extra):
+        if self.enabled and random.random() < self.sample_rate:
+            g._metrics = {"started": time.perf_counter(), "queries": 0, "sql_time": 0.0}
+
+    def _request_finished(self, sender, response, **extra):
+        sample = g.pop("_metrics", None)
+        if sample is None:
+            return
+        endpoint = request.endpoint or "unmatched"
+        values = {
+            "duration": time.perf_counter() - sample["started"],
+            "queries": sample["queries"],
+            "sql_duration": sample["sql_time"],
+            # Streamed responses have no length up front.
+            "response_size": response.calculate_content_length() or 0,
+        }
+        with self._lock:
+            series = self._endpoints.get(endpoint)
+            if series is None:
+                series = self._endpoints[endpoint] = {key: Histogram(buckets)
+                                                      for key, (_, _, buckets) in SERIES.items()}
+            for key, value in values.items():
+                series[key].observe(value)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and "_metrics" in g:
+            conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if starts and has_request_context() and "_metrics" in g:
+            g._metrics["queries"] += 1
+            g._metrics["sql_time"] += time.perf_counter() - starts.pop()
+
+    @staticmethod
+    def _copy(hist):
+        copy = Histogram(hist.buckets)
+        copy.counts = list(hist.counts)
+        copy.total, copy.count, copy.max = hist.total, hist.count, hist.max
+        return copy
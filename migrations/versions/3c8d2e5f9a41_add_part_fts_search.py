@@ -0,0 +1,54 @@
+"""Add part_fts full-text search index
+
+Revision ID: 3c8d2e5f9a41
+Revises: 1abf92dcabbf
+Create Date: 2026-10-18 09:12:04.511203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8d2e5f9a41'
+down_revision = '1abf92dcabbf'
+branch_labels = None
+depends_on = None
+
+
+# Keep in sync with PART_FTS_DDL in app.py
+PART_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS part_fts USING fts5("
+    "name, model_number, appliance_type, room, "
+    "content='part', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS part_fts_ai AFTER INSERT ON part BEGIN "
+    "INSERT INTO part_fts(rowid, name, model_number, appliance_type, room) "
+    "VALUES (new.id, new.name, new.model_number, new.appliance_type, new.room); END",
+    "CREATE TRIGGER IF NOT EXISTS part_fts_ad AFTER DELETE ON part BEGIN "
+    "INSERT INTO part_fts(part_fts, rowid, name, model_number, appliance_type, room) "
+    "VALUES ('delete', old.id, old.name, old.model_number, old.appliance_type, old.room); END",
+    "CREATE TRIGGER IF NOT EXISTS part_fts_au AFTER UPDATE OF name, model_number, appliance_type, room ON part BEGIN "
+    "INSERT INTO part_fts(part_fts, rowid, name, model_number, appliance_type, room) "
+    "VALUES ('delete', old.id, old.name, old.model_number, old.appliance_type, old.room); "
+    "INSERT INTO part_fts(rowid, name, model_number, appliance_type, room) "
+    "VALUES (new.id, new.name, new.model_number, new.appliance_type, new.room); END",
+]
+
+
+def upgrade():
+    # FTS5 is SQLite-only; other engines keep using the ILIKE search.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in PART_FTS_DDL:
+        op.execute(statement)
+    # Index the parts that already exist.
+    op.execute("INSERT INTO part_fts(part_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS part_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS part_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS part_fts_ai")
+    op.execute("DROP TABLE IF EXISTS part_fts")
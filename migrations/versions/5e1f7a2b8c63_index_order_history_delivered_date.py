@@ -0,0 +1,26 @@
+"""Index order_history.delivered_date
+
+Revision ID: 5e1f7a2b8c63
+Revises: 3c8d2e5f9a41
+Create Date: 2026-10-18 10:02:37.184420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1f7a2b8c63'
+down_revision = '3c8d2e5f9a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_history', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_history_delivered_date'), ['delivered_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_history', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_history_delivered_date'))
@@ -0,0 +1,32 @@
+"""Index action_log for the paginated warden log viewer
+
+Revision ID: 8a4b6c0d2e17
+Revises: 5e1f7a2b8c63
+Create Date: 2026-10-18 11:26:50.903318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4b6c0d2e17'
+down_revision = '5e1f7a2b8c63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('action_log', schema=None) as batch_op:
+        batch_op.create_index('ix_action_log_timestamp_id', ['timestamp', 'id'], unique=False)
+        batch_op.create_index('ix_action_log_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_action_log_entity_timestamp', ['entity', 'timestamp'], unique=False)
+        batch_op.create_index('ix_action_log_action_timestamp', ['action', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('action_log', schema=None) as batch_op:
+        batch_op.drop_index('ix_action_log_action_timestamp')
+        batch_op.drop_index('ix_action_log_entity_timestamp')
+        batch_op.drop_index('ix_action_log_user_id_timestamp')
+        batch_op.drop_index('ix_action_log_timestamp_id')
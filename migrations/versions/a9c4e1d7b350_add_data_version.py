@@ -0,0 +1,33 @@
+"""Add data_version counters for conditional GETs
+
+Revision ID: a9c4e1d7b350
+Revises: e7a3b5c9d1f2
+Create Date: 2026-10-18 16:11:48.230571
+
+"""
+from alembic import op
+import secrets
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4e1d7b350'
+down_revision = 'e7a3b5c9d1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_version = op.create_table('data_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Random like every later version (see app.new_data_version), so this
+    # database can't reuse keys cached against another one.
+    op.bulk_insert(data_version, [{'name': name, 'version': secrets.randbelow(2 ** 31)}
+                                  for name in ('part', 'order_history', 'turn_task')])
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,60 @@
+"""Add indexes for the hot filter columns
+
+Revision ID: b2d9e4f61a35
+Revises: 8a4b6c0d2e17
+Create Date: 2026-10-18 12:40:13.662091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2d9e4f61a35'
+down_revision = '8a4b6c0d2e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # turn_task was only ever created by db.create_all(); make sure it exists.
+    if not sa.inspect(op.get_bind()).has_table('turn_task'):
+        op.create_table('turn_task',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('building', sa.String(length=50), nullable=True),
+        sa.Column('side', sa.String(length=50), nullable=True),
+        sa.Column('floor', sa.Integer(), nullable=True),
+        sa.Column('unit_number', sa.String(length=10), nullable=True),
+        sa.Column('task_name', sa.String(length=100), nullable=True),
+        sa.Column('is_completed', sa.Boolean(), nullable=True),
+        sa.Column('completed_by', sa.String(length=100), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    with op.batch_alter_table('part', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_part_room'), ['room'], unique=False)
+        batch_op.create_index(batch_op.f('ix_part_appliance_type'), ['appliance_type'], unique=False)
+
+    with op.batch_alter_table('order_history', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_history_part_id'), ['part_id'], unique=False)
+        batch_op.create_index('ix_order_history_undelivered', ['part_id', 'order_date'], unique=False,
+                              sqlite_where=sa.text('delivered_date IS NULL'),
+                              postgresql_where=sa.text('delivered_date IS NULL'))
+
+    with op.batch_alter_table('turn_task', schema=None) as batch_op:
+        batch_op.create_index('ix_turn_task_year_building_floor', ['year', 'building', 'floor'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('turn_task', schema=None) as batch_op:
+        batch_op.drop_index('ix_turn_task_year_building_floor')
+
+    with op.batch_alter_table('order_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_history_undelivered')
+        batch_op.drop_index(batch_op.f('ix_order_history_part_id'))
+
+    with op.batch_alter_table('part', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_part_appliance_type'))
+        batch_op.drop_index(batch_op.f('ix_part_room'))
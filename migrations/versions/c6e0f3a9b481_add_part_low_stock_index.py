@@ -0,0 +1,29 @@
+"""Add partial low-stock index on part
+
+Revision ID: c6e0f3a9b481
+Revises: b2d9e4f61a35
+Create Date: 2026-10-18 14:05:48.220917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e0f3a9b481'
+down_revision = 'b2d9e4f61a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('part', schema=None) as batch_op:
+        batch_op.create_index('ix_part_low_stock',
+                              ['room', 'id', 'name', 'model_number', 'count', 'threshold'], unique=False,
+                              sqlite_where=sa.text('count < threshold'),
+                              postgresql_where=sa.text('count < threshold'))
+
+
+def downgrade():
+    with op.batch_alter_table('part', schema=None) as batch_op:
+        batch_op.drop_index('ix_part_low_stock')
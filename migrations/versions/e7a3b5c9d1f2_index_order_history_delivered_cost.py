@@ -0,0 +1,26 @@
+"""Covering index for the delivered orders total
+
+Revision ID: e7a3b5c9d1f2
+Revises: d41f8c2a7e90
+Create Date: 2026-10-18 15:02:37.904118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3b5c9d1f2'
+down_revision = 'd41f8c2a7e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order_history', schema=None) as batch_op:
+        batch_op.create_index('ix_order_history_delivered_cost', ['delivered_date', 'total_cost'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_history_delivered_cost')
@@ -1,7 +1,64 @@
+import base64
+import csv
+import io
+import os
+import smtplib
 import unittest
-from app import app, db, Part
+
+# Keep tests off the real inventory.db; must be set before app is imported.
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import (app, db, Part, User, OrderHistory, ActionLog, TurnTask, budget_sheet, usage_by_window,
+                 get_audit_writer, clear_turn_options_cache, OutboundEmail, queue_email, get_engine,
+                 load_user, user_cache_info, prefetch_active_orders, request_metrics, data_versions,
+                 get_fragment_cache, encode_cursor, turn_options_cache)
+from budget_sheet import StaticSheetClient
+from fragment_cache import DiskBackend, FragmentCache
+from mail_queue import MailWorker
+from parts_io import read_parts, upsert_parts, export_parts
+from turn_seed import build_turn_rows, load_layout
 from flask import json
-from datetime import datetime, date
+from sqlalchemy import create_engine, event, insert
+from datetime import datetime, date, timedelta
+import tempfile
+
+# Sample property for the turn tests; the real layout is site configuration.
+TURN_LAYOUT = {
+    "tasks": ["Paint", "Deep Clean", "Replace HVAC Filter"],
+    "buildings": [
+        {"name": "A", "sides": ["East", "West"], "floors": 3, "units_per_side": 4},
+        {"name": "B", "sides": ["East", "West"], "floors": 2, "units_per_side": 3},
+    ],
+}
+
+def create_user(username='tech', role='technician'):
+    user = User(username=username, role=role)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+def login_as(client, user_id):
+    # Flask-Login reads the user id straight from the session cookie.
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+def count_statements(client, url):
+    # SQL statements one request issues, counted at the engine.
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, (url, response.status_code)
+    return len(statements)
 
 # Integration & End-to-End Tests
 class IntegrationTests(unittest.TestCase):
@@ -184,32 +241,21 @@ class HistoryTests(unittest.TestCase):
         self.client = app.test_client()
         with app.app_context():
             db.create_all()
-            # Create parts that are delivered with specific delivered_date values.
-            part1 = Part(
-                name='Delivered Part January', 
-                model_number='DELJAN', 
-                count=10, 
-                cost=20.0, 
-                room='Kitchen',
-                order_status='Delivered',
-                purchase_total_cost=100.00,
-                purchased_quantity=5,
-                delivered_date=date(2025, 1, 15)
-            )
-            part2 = Part(
-                name='Delivered Part February', 
-                model_number='DELFEB', 
-                count=8, 
-                cost=15.0, 
-                room='Bathroom',
-                order_status='Delivered',
-                purchase_total_cost=80.00,
-                purchased_quantity=4,
-                delivered_date=date(2025, 2, 10)
-            )
+            # Create parts with orders delivered on specific delivered_date values.
+            part1 = Part(name='Delivered Part January', model_number='DELJAN', count=10, cost=20.0, room='Kitchen')
+            part2 = Part(name='Delivered Part February', model_number='DELFEB', count=8, cost=15.0, room='Bathroom')
             db.session.add(part1)
             db.session.add(part2)
+            db.session.flush()
+            db.session.add(OrderHistory(part_id=part1.id, purchased_quantity=5, total_cost=100.00,
+                                        order_date=date(2025, 1, 2), delivered_date=date(2025, 1, 15)))
+            db.session.add(OrderHistory(part_id=part2.id, purchased_quantity=4, total_cost=80.00,
+                                        order_date=date(2025, 2, 1), delivered_date=date(2025, 2, 10)))
+            # Outside the year being viewed.
+            db.session.add(OrderHistory(part_id=part2.id, purchased_quantity=1, total_cost=999.00,
+                                        order_date=date(2024, 2, 1), delivered_date=date(2024, 2, 10)))
             db.session.commit()
+            login_as(self.client, create_user())
 
     def tearDown(self):
         with app.app_context():
@@ -220,7 +266,1107 @@ class HistoryTests(unittest.TestCase):
         response = self.client.get('/history?year=2025')
         self.assertIn(b'January', response.data)
         self.assertIn(b'February', response.data)
-        self.assertIn(b'2025 Total: 180.0', response.data)
+        self.assertIn(b'Overall Total: 180.0', response.data)
+        # Month order lists load only when expanded.
+        self.assertNotIn(b'DELJAN', response.data)
+
+    def test_expanded_month_lists_its_orders(self):
+        response = self.client.get('/history?year=2025&month=1')
+        self.assertIn(b'DELJAN', response.data)
+        self.assertNotIn(b'DELFEB', response.data)
+
+    def test_out_of_range_year_and_page_are_clamped(self):
+        for url in ['/history?year=9999', '/history?year=9999&month=12', '/history?year=0', '/history?year=-5',
+                    '/history?year=2025&month=1&page=100000000000000000000']:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIn(b'DELJAN', self.client.get('/history?year=2025&month=1&page=7').data)
+
+# Combined Orders Tests
+class CombinedOrdersTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['DELIVERED_PAGE_SIZE'] = 10
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            part = Part(name='Water Heater', model_number='CMB001', count=1, cost=10.0, room='Other')
+            db.session.add(part)
+            db.session.flush()
+            db.session.add_all(OrderHistory(part_id=part.id, purchased_quantity=1, total_cost=2.5,
+                                            order_date=date(2025, 1, 1),
+                                            delivered_date=date(2025, 1, 1) + timedelta(days=i // 3))
+                               for i in range(25))
+            db.session.add(OrderHistory(part_id=part.id, purchased_quantity=2, total_cost=40.0))
+            db.session.commit()
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        app.config['DELIVERED_PAGE_SIZE'] = 50
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_total_covers_all_deliveries_but_list_is_one_page(self):
+        response = self.client.get('/combined')
+        self.assertIn(b'Overall Delivered Total: 62.5', response.data)
+        self.assertEqual(response.data.count(b'<td>2.5</td>'), 10)
+        self.assertIn(b'load-more-delivered', response.data)
+
+    def test_load_more_walks_remaining_deliveries(self):
+        html = self.client.get('/combined').data.decode()
+        after = html.split('data-after="')[1].split('"')[0]
+        rows = 10
+        while after:
+            data = json.loads(self.client.get(f'/combined/delivered?after={after}').data)
+            rows += data['html'].count('<tr>')
+            after = data['next_cursor']
+        self.assertEqual(rows, 25)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        first = json.loads(self.client.get('/combined/delivered').data)
+        for after in [encode_cursor('2025-01-05', 'x'), encode_cursor(5, 3), encode_cursor('not-a-date', 3),
+                      base64.urlsafe_b64encode(b'{"id": "x"}').decode()]:
+            with self.subTest(after=after):
+                response = self.client.get(f'/combined/delivered?after={after}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.data), first)
+
+# Dashboard Pagination Tests
+class DashboardPaginationTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            for i in range(7):
+                db.session.add(Part(name=f'Page Part {i}', model_number=f'PG{i:03d}', count=1 if i == 6 else 10,
+                                    cost=1.0, room='Kitchen' if i % 2 else 'Bathroom', threshold=5))
+            db.session.commit()
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_keyset_pages_cover_every_part_once(self):
+        seen = []
+        url = '/?per_page=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            html = response.data.decode()
+            seen += [i for i in range(7) if f'<td>Page Part {i}</td>' in html]
+            if 'Next Page' in html:
+                url = html[:html.index('Next Page')].rsplit('href="', 1)[1].split('"', 1)[0].replace('&amp;', '&')
+            else:
+                url = None
+        self.assertEqual(sorted(seen), list(range(7)))
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        for after in [encode_cursor(['Kitchen'], 1), encode_cursor('Kitchen', 'x'), encode_cursor('Kitchen', True)]:
+            with self.subTest(after=after):
+                response = self.client.get(f'/?per_page=3&after={after}')
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(b'<td>Page Part 0</td>', response.data)
+
+    def test_alerts_span_all_pages(self):
+        # Part 6 sorts last (Bathroom rows first) yet its alert shows on page one.
+        response = self.client.get('/?per_page=2')
+        self.assertIn(b'Page Part 6 (1 in stock', response.data)
+        self.assertNotIn(b'<td>Page Part 6</td>', response.data)
+
+# Full-Text Search Tests
+class PartSearchTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Part(name='Dryer Belt', model_number='WE12M29', count=10, cost=9.0,
+                                room='Laundry', appliance_type='Dryer'))
+            db.session.add(Part(name='Bake Element', model_number='WB44T10011', count=10, cost=30.0,
+                                room='Kitchen', appliance_type='Oven'))
+            db.session.add(Part(name='Drain Hose', model_number='DH200', count=10, cost=12.0,
+                                room='Laundry', appliance_type='Washing Machine'))
+            db.session.add(Part(name='Lint Screen', model_number='LS300', count=10, cost=5.0,
+                                room='Laundry', appliance_type='Dryer'))
+            db.session.commit()
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_substring_of_model_number(self):
+        response = self.client.get('/?search=t1001')
+        self.assertIn(b'Bake Element', response.data)
+        self.assertNotIn(b'Dryer Belt', response.data)
+
+    def test_name_matches_rank_above_appliance_matches(self):
+        response = self.client.get('/?search=dryer')
+        html = response.data.decode()
+        self.assertNotIn('Drain Hose', html)
+        self.assertLess(html.index('<td>Dryer Belt</td>'), html.index('<td>Lint Screen</td>'))
+
+    def test_index_follows_updates_and_deletes(self):
+        with app.app_context():
+            part = Part.query.filter_by(model_number='DH200').first()
+            part.name = 'Inlet Hose'
+            db.session.commit()
+        self.assertIn(b'Inlet Hose', self.client.get('/?search=inlet').data)
+        self.assertNotIn(b'Inlet Hose', self.client.get('/?search=drain').data)
+        with app.app_context():
+            db.session.delete(Part.query.filter_by(model_number='DH200').first())
+            db.session.commit()
+        self.assertNotIn(b'Inlet Hose', self.client.get('/?search=inlet').data)
+
+    def test_short_terms_fall_back_to_ilike(self):
+        response = self.client.get('/?search=dh')
+        self.assertIn(b'Drain Hose', response.data)
+
+    def test_search_combined_with_room_and_appliance_filters(self):
+        for url, shown in [('/?search=dryer&room=Laundry', True), ('/?search=dryer&room=Kitchen', False),
+                           ('/?search=dryer&appliance=Dryer', True), ('/?search=dryer&appliance=Oven', False)]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b'<td>Dryer Belt</td>' in response.data, shown)
+
+# Budget Sheet Snapshot Tests
+class BudgetSnapshotTests(unittest.TestCase):
+    SHEET = [
+        ['Line', 'JAN', 'FEB', 'MARCH', 'APRIL', 'MAY', 'JUNE', 'JULY', 'AUGUST', 'SEPT', 'OCT', 'NOV', 'DEC'],
+        ['Appliance Parts'] + ['100'] * 12,
+        ['HVAC Parts'] + ['50'] * 12,
+    ]
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['BUDGET_REFRESH_INTERVAL'] = 0
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = (budget_sheet.client, budget_sheet.snapshot_path, budget_sheet._values, budget_sheet._fetched_at)
+        budget_sheet.client = StaticSheetClient(self.SHEET)
+        budget_sheet.snapshot_path = os.path.join(self.tmpdir.name, 'budget_snapshot.json')
+        budget_sheet._values = budget_sheet._fetched_at = None
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        budget_sheet.client, budget_sheet.snapshot_path, budget_sheet._values, budget_sheet._fetched_at = self.saved
+        self.tmpdir.cleanup()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_sheet_fetched_once_and_persisted(self):
+        for _ in range(3):
+            response = self.client.get('/budget?q=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'$450.0', response.data)
+        self.assertEqual(budget_sheet.client.fetches, 1)
+        self.assertTrue(os.path.exists(budget_sheet.snapshot_path))
+
+    def test_serves_last_snapshot_when_sheet_is_down(self):
+        budget_sheet.refresh()
+        budget_sheet._values = budget_sheet._fetched_at = None
+
+        class DownClient:
+            def fetch_values(self):
+                raise ConnectionError("sheets unavailable")
+
+        budget_sheet.client = DownClient()
+        response = self.client.get('/budget?q=1')
+        self.assertIn(b'$450.0', response.data)
+
+# Trends Aggregation Tests
+class TrendsTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            used = Part(name='Used Part', model_number='USE001', count=3, cost=2.0, room='Kitchen')
+            idle = Part(name='Idle Part', model_number='IDL001', count=3, cost=2.0, room='Kitchen')
+            db.session.add_all([used, idle])
+            db.session.flush()
+            today = date.today()
+            db.session.add_all([
+                OrderHistory(part_id=used.id, purchased_quantity=2, total_cost=20.0, delivered_date=today),
+                OrderHistory(part_id=used.id, purchased_quantity=5, total_cost=50.0, delivered_date=date(2020, 3, 1)),
+                OrderHistory(part_id=used.id, purchased_quantity=9, total_cost=90.0),
+            ])
+            db.session.commit()
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_windows_summed_in_sql(self):
+        today = date.today()
+        with app.app_context():
+            usage = {item['part'].model_number: item for item in usage_by_window({
+                'week': (today - timedelta(days=today.weekday()), None),
+                'custom': (date(2020, 1, 1), date(2020, 12, 31)),
+            })}
+        self.assertEqual(usage['USE001']['week_used'], 2)
+        self.assertEqual(usage['USE001']['custom_used'], 5)
+        self.assertEqual(usage['USE001']['custom_cost'], 50.0)
+        self.assertEqual(usage['IDL001']['week_used'], 0)
+
+    def test_custom_range_column(self):
+        response = self.client.get('/trends?start=2020-01-01&end=2020-12-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Used in Range', response.data)
+        self.assertIn(b'$50.0', response.data)
+
+    def test_open_ended_range_up_to_date_max(self):
+        response = self.client.get('/trends?start=2020-01-01&end=9999-12-31')
+        self.assertEqual(response.status_code, 200)
+        # Every delivery since 2020, including this week's.
+        self.assertIn(b'<td>$70.0</td>', response.data)
+
+# Audit Log Writer Tests
+class AuditLogTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            part = Part(name='Audited Part', model_number='AUD001', count=5, cost=10.0, room='Other')
+            db.session.add(part)
+            db.session.commit()
+            self.part_id = part.id
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        app.config['AUDIT_MODE'] = 'transaction'
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_log_row_written_in_same_transaction(self):
+        response = self.client.post(f'/api/increment/{self.part_id}')
+        self.assertTrue(json.loads(response.data)['success'])
+        with app.app_context():
+            logs = ActionLog.query.all()
+            self.assertEqual([(log.action, log.entity_id) for log in logs], [('increment', self.part_id)])
+
+    def test_buffered_rows_written_after_commit(self):
+        app.config['AUDIT_MODE'] = 'buffered'
+        self.client.post(f'/api/increment/{self.part_id}')
+        self.client.post(f'/api/decrement/{self.part_id}')
+        with app.app_context():
+            get_audit_writer().flush()
+            actions = sorted(log.action for log in ActionLog.query.all())
+        self.assertEqual(actions, ['decrement', 'increment'])
+
+# Stock Adjustment Tests
+class StockAdjustTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            parts = [Part(name='Filter', model_number='ADJ001', count=3, cost=1.0, room='HVAC'),
+                     Part(name='Bulb', model_number='ADJ002', count=1, cost=1.0, room='Living')]
+            db.session.add_all(parts)
+            db.session.commit()
+            self.filter_id, self.bulb_id = parts[0].id, parts[1].id
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def count(self, part_id):
+        with app.app_context():
+            return db.session.get(Part, part_id).count
+
+    def test_decrement_stops_at_zero(self):
+        self.assertEqual(json.loads(self.client.post(f'/api/decrement/{self.bulb_id}').data)['new_count'], 0)
+        response = self.client.post(f'/api/decrement/{self.bulb_id}')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.count(self.bulb_id), 0)
+
+    def test_batch_adjust_reports_each_item(self):
+        response = self.client.post('/api/adjust', json={'adjustments': [
+            {'part_id': self.filter_id, 'delta': 5},
+            {'part_id': self.bulb_id, 'delta': -2},
+            {'part_id': 9999, 'delta': 1},
+            {'part_id': self.filter_id, 'delta': -1},
+        ]})
+        data = json.loads(response.data)
+        self.assertFalse(data['success'])
+        self.assertEqual([r['success'] for r in data['results']], [True, False, False, True])
+        self.assertEqual(data['results'][0]['new_count'], 8)
+        self.assertEqual(data['results'][1]['error'], 'Count would go below 0')
+        self.assertEqual(data['results'][2]['error'], 'Part not found')
+        self.assertEqual(self.count(self.filter_id), 7)
+        self.assertEqual(self.count(self.bulb_id), 1)
+        with app.app_context():
+            self.assertEqual(ActionLog.query.filter_by(action='adjust').count(), 2)
+
+    def test_batch_adjust_rejects_bad_payload(self):
+        self.assertEqual(self.client.post('/api/adjust', json={'adjustments': []}).status_code, 400)
+
+    def test_batch_adjust_rejects_out_of_range_items(self):
+        response = self.client.post('/api/adjust', json={'adjustments': [
+            {'part_id': self.filter_id, 'delta': 10 ** 30},
+            {'part_id': 10 ** 30, 'delta': 1},
+            {'part_id': self.filter_id, 'delta': 1},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual([r['success'] for r in data['results']], [False, False, True])
+        self.assertIn('delta must be between', data['results'][0]['error'])
+        self.assertEqual(self.count(self.filter_id), 4)
+
+# Warden Log Viewer Tests
+class WardenLogTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            warden_id = create_user('warden', 'warden')
+            tech_id = create_user('tech')
+            for i in range(5):
+                db.session.add(ActionLog(user_id=tech_id if i % 2 else warden_id, action='update' if i else 'delete',
+                                         entity='Part', entity_id=100 + i, details=f'log entry {i}',
+                                         timestamp=datetime(2025, 5, 1 + i, 12, 0)))
+            db.session.commit()
+            login_as(self.client, warden_id)
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_pages_newest_first(self):
+        html = self.client.get('/warden/logs?per_page=3').data.decode()
+        self.assertLess(html.index('log entry 4'), html.index('log entry 2'))
+        self.assertNotIn('log entry 1', html)
+        href = html[:html.index('Older')].rsplit('href="', 1)[1].split('"', 1)[0].replace('&amp;', '&')
+        html = self.client.get(href).data.decode()
+        self.assertIn('log entry 1', html)
+        self.assertIn('log entry 0', html)
+        self.assertNotIn('log entry 2', html)
+
+    def test_filters(self):
+        html = self.client.get('/warden/logs?user=tech&action=update').data.decode()
+        self.assertEqual([i for i in range(5) if f'log entry {i}' in html], [1, 3])
+        html = self.client.get('/warden/logs?start=2025-05-02&end=2025-05-03').data.decode()
+        self.assertEqual([i for i in range(5) if f'log entry {i}' in html], [1, 2])
+        response = self.client.get('/warden/logs?start=2025-05-02&end=9999-12-31')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i for i in range(5) if f'log entry {i}' in response.data.decode()], [1, 2, 3, 4])
+        self.assertEqual(self.client.get('/warden/logs/export.csv?end=9999-12-31').status_code, 200)
+
+# Turn Page Tests
+class TurnPageTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        clear_turn_options_cache()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        app.config['TURN_LAYOUT_PATH'] = os.path.join(self.tmpdir.name, 'turn_layout.json')
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add_all([
+                TurnTask(year=2024, building='B', side='West', floor=2, unit_number='B-201', task_name='Paint'),
+                TurnTask(year=2025, building='A', side='East', floor=1, unit_number='A-101', task_name='Paint'),
+                TurnTask(year=2025, building='C', side='East', floor=1, unit_number='C-101', task_name='Paint'),
+            ])
+            db.session.commit()
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_dropdown_options(self):
+        html = self.client.get('/turn?year=2025').data.decode()
+        self.assertIn('<option value="2024"', html)
+        self.assertIn('<option value="C"', html)
+        self.assertNotIn('<option value="B"', html)
+
+    def test_new_tasks_clear_cached_options(self):
+        self.client.get('/turn?year=2025')
+        with app.app_context():
+            db.session.add(TurnTask(year=2025, building='D', floor=1, unit_number='D-101', task_name='Paint'))
+            db.session.commit()
+        self.assertIn(b'<option value="D"', self.client.get('/turn?year=2025').data)
+
+    def test_options_cache_is_bounded_and_year_clamped(self):
+        for year in range(1900, 1900 + 2 * app.config['TURN_OPTIONS_CACHE_SIZE']):
+            self.client.get(f'/turn?year={year}')
+        self.assertLessEqual(len(turn_options_cache), app.config['TURN_OPTIONS_CACHE_SIZE'])
+        for year in (10 ** 30, -10 ** 30):
+            with self.subTest(year=year):
+                self.assertEqual(self.client.get(f'/turn?year={year}').status_code, 200)
+
+    def test_complete_whole_unit_in_one_call(self):
+        with app.app_context():
+            db.session.add(TurnTask(year=2025, building='A', floor=1, unit_number='A-101', task_name='Carpet'))
+            # Same unit number in another building.
+            db.session.add(TurnTask(year=2025, building='B', floor=1, unit_number='A-101', task_name='Paint'))
+            db.session.commit()
+        response = self.client.post('/turn/tasks/complete',
+                                    json={'completed': True, 'year': 2025, 'building': 'A', 'unit_number': 'A-101'})
+        data = json.loads(response.data)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual(data['completed_by'], 'tech')
+        with app.app_context():
+            done = {(t.building, t.unit_number, t.is_completed) for t in TurnTask.query.filter_by(year=2025)}
+        self.assertEqual(done, {('A', 'A-101', True), ('B', 'A-101', False), ('C', 'C-101', False)})
+        # Reopening by id only touches the listed tasks.
+        with app.app_context():
+            task_id = TurnTask.query.filter_by(building='A', unit_number='A-101', task_name='Paint').first().id
+        data = json.loads(self.client.post('/turn/tasks/complete', json={'completed': False, 'task_ids': [task_id]}).data)
+        self.assertEqual(data['updated'], 1)
+
+    def test_setup_seeds_each_unit_once(self):
+        with open(app.config['TURN_LAYOUT_PATH'], 'w') as f:
+            json.dump(TURN_LAYOUT, f)
+        with app.app_context():
+            warden_id = create_user('warden', 'warden')
+        login_as(self.client, warden_id)
+        self.client.post('/turn/setup', data={'year': '2026'})
+        with app.app_context():
+            count = TurnTask.query.filter_by(year=2026).count()
+            self.assertEqual(count, len(list(build_turn_rows(2026, TURN_LAYOUT, TURN_LAYOUT['tasks']))))
+        response = self.client.post('/turn/setup', data={'year': '2026'}, follow_redirects=True)
+        self.assertIn(b'Turn tasks for 2026 already exist.', response.data)
+        with app.app_context():
+            self.assertEqual(TurnTask.query.filter_by(year=2026).count(), count)
+
+    def test_setup_refuses_without_a_layout(self):
+        with app.app_context():
+            warden_id = create_user('warden', 'warden')
+        login_as(self.client, warden_id)
+        response = self.client.post('/turn/setup', data={'year': '2026'}, follow_redirects=True)
+        self.assertIn(b'No turn layout configured', response.data)
+        with app.app_context():
+            self.assertEqual(TurnTask.query.filter_by(year=2026).count(), 0)
+
+    def test_setup_rejects_incomplete_buildings(self):
+        with app.app_context():
+            warden_id = create_user('warden', 'warden')
+        login_as(self.client, warden_id)
+        path = app.config['TURN_LAYOUT_PATH']
+        for buildings, message in [([{"name": "A"}], "building 'A': \"sides\""),
+                                   ([{"name": "A", "sides": ["East"], "floors": "3", "units_per_side": 2}],
+                                    "building 'A': \"floors\""),
+                                   (["A"], "building '#1': expected a JSON object")]:
+            with self.subTest(buildings=buildings):
+                with open(path, 'w') as f:
+                    json.dump({"tasks": ["Paint"], "buildings": buildings}, f)
+                with self.assertRaises(ValueError) as raised:
+                    load_layout(path)
+                self.assertIn(message, str(raised.exception))
+                response = self.client.post('/turn/setup', data={'year': '2026'}, follow_redirects=True)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(b'Turn setup failed', response.data)
+        with app.app_context():
+            self.assertEqual(TurnTask.query.filter_by(year=2026).count(), 0)
+
+    def test_complete_rejects_bad_payload(self):
+        response = self.client.post('/turn/tasks/complete', json={'task_ids': ['x']})
+        self.assertEqual(response.status_code, 400)
+        with app.app_context():
+            task_id = TurnTask.query.filter_by(unit_number='A-101').first().id
+        response = self.client.post('/turn/tasks/complete', json={'completed': 'false', 'task_ids': [task_id]})
+        self.assertEqual(response.status_code, 400)
+        for payload in [{'task_ids': [10 ** 30]}, {'year': 10 ** 30, 'building': 'A', 'unit_number': 'A-101'},
+                        {'year': 2025, 'unit_number': 'A-101'}]:
+            with self.subTest(payload=payload):
+                response = self.client.post('/turn/tasks/complete', json=payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(json.loads(response.data)['success'])
+        with app.app_context():
+            self.assertFalse(db.session.get(TurnTask, task_id).is_completed)
+
+# Low Stock Alert Tests
+class LowStockAlertTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            part = Part(name='Smoke Detector', model_number='LOW001', count=2, cost=15.0, room='Bedroom', threshold=3)
+            db.session.add_all([part, Part(name='Plenty', model_number='LOW002', count=50, cost=1.0, room='Other')])
+            db.session.commit()
+            self.part_id = part.id
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def alerts(self):
+        return [a['model_number'] for a in json.loads(self.client.get('/api/alerts').data)['alerts']]
+
+    def test_alerts_follow_count_and_threshold_changes(self):
+        self.assertEqual(self.alerts(), ['LOW001'])
+        self.client.post('/api/adjust', json={'adjustments': [{'part_id': self.part_id, 'delta': 1}]})
+        self.assertEqual(self.alerts(), [])
+        with app.app_context():
+            db.session.get(Part, self.part_id).threshold = 10
+            db.session.commit()
+        self.assertEqual(self.alerts(), ['LOW001'])
+
+# Conditional GET Tests
+class ConditionalGetTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            part = Part(name='Filter', model_number='ETAG01', count=1, cost=5.0, room='Kitchen', threshold=3)
+            db.session.add(part)
+            db.session.commit()
+            self.part_id = part.id
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.headers['ETag']
+
+    def test_current_version_gets_304_from_one_query(self):
+        etag = self.etag('/')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                response = self.client.get('/', headers={'If-None-Match': etag})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(len(statements), 1)
+        self.assertIn('data_version', statements[0])
+
+    def test_orm_and_bulk_changes_bump_only_their_tables(self):
+        index, alerts, turn = self.etag('/'), self.etag('/api/alerts'), self.etag('/turn')
+        self.client.post('/api/adjust', json={'adjustments': [{'part_id': self.part_id, 'delta': 1}]})
+        self.assertNotEqual(self.etag('/api/alerts'), alerts)
+        self.assertEqual(self.etag('/turn'), turn)
+        index = self.etag('/')
+        with app.app_context():
+            db.session.add(OrderHistory(part_id=self.part_id, purchased_quantity=1, total_cost=5.0))
+            db.session.commit()
+        self.assertNotEqual(self.etag('/'), index)
+        with app.app_context():
+            db.session.add(TurnTask(year=date.today().year, building='A', unit_number='A-101', task_name='Paint'))
+            db.session.commit()
+        self.assertNotEqual(self.etag('/turn'), turn)
+
+    def test_recreated_database_does_not_reuse_versions(self):
+        with app.app_context():
+            before = data_versions(['part', 'order_history', 'turn_task'])
+            db.drop_all()
+            db.create_all()
+            after = data_versions(['part', 'order_history', 'turn_task'])
+        self.assertEqual(set(after), set(before))
+        self.assertTrue(all(after[name] != before[name] for name in after))
+
+    def test_rolled_back_change_keeps_version(self):
+        with app.app_context():
+            before = data_versions(['part'])
+            db.session.get(Part, self.part_id).count = 40
+            db.session.flush()
+            db.session.rollback()
+            self.assertEqual(data_versions(['part']), before)
+
+# Parts Table Fragment Cache Tests
+class FragmentCacheTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        get_fragment_cache().clear()
+        with app.app_context():
+            db.create_all()
+            part = Part(name='Gasket', model_number='FRAG01', count=9, cost=3.0, room='Kitchen')
+            db.session.add(part)
+            db.session.commit()
+            self.part_id = part.id
+            login_as(self.client, create_user())
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_repeat_page_is_served_from_cache_until_a_part_changes(self):
+        cache = get_fragment_cache()
+        before = cache.info()
+        self.assertIn(b'Gasket', self.client.get('/').data)
+        self.assertIn(b'Gasket', self.client.get('/').data)
+        self.assertIn(b'Gasket', self.client.get('/?room=Kitchen').data)
+        after = cache.info()
+        self.assertEqual(after['misses'] - before['misses'], 2)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        with app.app_context():
+            db.session.get(Part, self.part_id).name = 'Seal'
+            db.session.commit()
+        page = self.client.get('/').data
+        self.assertIn(b'Seal', page)
+        self.assertNotIn(b'Gasket', page)
+
+    def test_new_build_does_not_serve_old_fragments(self):
+        cache = get_fragment_cache()
+        saved = app.config['BUILD_VERSION']
+        self.client.get('/')
+        before = cache.info()
+        app.config['BUILD_VERSION'] = 'next-deploy'
+        try:
+            self.client.get('/')
+        finally:
+            app.config['BUILD_VERSION'] = saved
+        self.assertEqual(cache.info()['misses'] - before['misses'], 1)
+
+    def test_disk_backend_is_shared_and_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'fragments.db')
+            worker_a = FragmentCache(DiskBackend(path, maxsize=2, touch_interval=0))
+            worker_b = FragmentCache(DiskBackend(path, maxsize=2, touch_interval=0))
+            worker_a.set(['one'], '<p>1</p>')
+            worker_a.set(['two'], '<p>2</p>')
+            self.assertEqual(worker_b.get(['one']), '<p>1</p>')
+            worker_b.set(['three'], '<p>3</p>')
+            self.assertIsNone(worker_a.get(['two']))
+            self.assertEqual(worker_a.get(['one']), '<p>1</p>')
+            self.assertEqual(worker_a.info()['size'], 2)
+
+    def test_disk_backend_hits_only_write_after_touch_interval(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            backend = DiskBackend(os.path.join(tmpdir, 'fragments.db'), maxsize=10, touch_interval=60)
+            backend.set('key', '<p>1</p>')
+            conn = backend._connection()
+            writes = conn.total_changes
+            for _ in range(3):
+                self.assertEqual(backend.get('key'), '<p>1</p>')
+            self.assertEqual(conn.total_changes, writes)
+            backend.touch_interval = 0
+            backend.get('key')
+            self.assertEqual(conn.total_changes, writes + 1)
+
+# User Loader Cache Tests
+class UserCacheTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            self.user_id = create_user('cached_warden', 'warden')
+            login_as(self.client, self.user_id)
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_repeat_requests_skip_the_user_query(self):
+        before = user_cache_info()
+        self.client.get('/api/alerts')
+        self.client.get('/api/alerts')
+        after = user_cache_info()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_role_change_invalidates_entry(self):
+        with app.app_context():
+            self.assertEqual(load_user(self.user_id).role, 'warden')
+            db.session.get(User, self.user_id).role = 'technician'
+            db.session.commit()
+            self.assertEqual(load_user(self.user_id).role, 'technician')
+        self.assertNotEqual(self.client.get('/warden/logs').status_code, 200)
+
+# Active Order Prefetch Tests
+class ActiveOrderTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        with app.app_context():
+            db.create_all()
+            parts = [Part(name=f'Part {i}', model_number=f'ACT{i:03d}', count=1, cost=1.0, room='Other')
+                     for i in range(3)]
+            db.session.add_all(parts)
+            db.session.flush()
+            db.session.add_all([
+                OrderHistory(part_id=parts[0].id, purchased_quantity=1, total_cost=1.0, order_date=date(2025, 1, 1)),
+                OrderHistory(part_id=parts[0].id, purchased_quantity=2, total_cost=2.0, order_date=date(2025, 2, 1)),
+                OrderHistory(part_id=parts[0].id, purchased_quantity=3, total_cost=3.0, order_date=date(2025, 3, 1),
+                             delivered_date=date(2025, 3, 5)),
+                OrderHistory(part_id=parts[1].id, purchased_quantity=4, total_cost=4.0, order_date=date(2025, 1, 1),
+                             delivered_date=date(2025, 1, 5)),
+            ])
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_prefetch_matches_property_in_one_query(self):
+        with app.app_context():
+            expected = [(p.active_order.purchased_quantity if p.active_order else None)
+                        for p in Part.query.order_by(Part.id)]
+            db.session.expunge_all()
+            parts = Part.query.order_by(Part.id).all()
+            statements = []
+            record = lambda *args: statements.append(args[2])
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                prefetch_active_orders(parts)
+                actual = [(p.active_order.purchased_quantity if p.active_order else None) for p in parts]
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(expected, [2, None, None])
+        self.assertEqual(actual, expected)
+        self.assertEqual(len(statements), 1)
+
+# Streaming Export Tests
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['EXPORT_BATCH_SIZE'] = 2
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            self.warden_id = create_user('warden', 'warden')
+            part = Part(name='Pool Pump', model_number='EXP001', count=1, cost=10.0, room='Other')
+            db.session.add(part)
+            db.session.flush()
+            for day in range(1, 6):
+                db.session.add(OrderHistory(part_id=part.id, purchased_quantity=1, total_cost=day * 10.0,
+                                            order_date=date(2025, 3, day),
+                                            expense_line='Pools & Exterior' if day % 2 else 'Janitorial'))
+                db.session.add(ActionLog(user_id=self.warden_id, action='update', entity='Part',
+                                         entity_id=part.id, timestamp=datetime(2025, 3, day)))
+            db.session.commit()
+            login_as(self.client, self.warden_id)
+
+    def tearDown(self):
+        app.config['EXPORT_BATCH_SIZE'] = 1000
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_orders_csv_filters_by_date_and_expense_line(self):
+        response = self.client.get('/export/orders.csv?start=2025-03-02&end=2025-03-05&expense_line=Pools+%26+Exterior')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([(r['order_date'], r['total_cost'], r['model_number']) for r in rows],
+                         [('2025-03-03', '30.0', 'EXP001'), ('2025-03-05', '50.0', 'EXP001')])
+
+    def test_end_of_calendar_leaves_range_open(self):
+        response = self.client.get('/export/orders.csv?start=2025-03-03&end=9999-12-31&expense_line=Pools+%26+Exterior')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([r['order_date'] for r in rows], ['2025-03-03', '2025-03-05'])
+
+    def test_logs_jsonl_is_oldest_first_and_warden_only(self):
+        response = self.client.get('/warden/logs/export.jsonl?user=warden&end=2025-03-03')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([r['timestamp'][:10] for r in rows], ['2025-03-01', '2025-03-02', '2025-03-03'])
+        self.assertEqual({r['username'] for r in rows}, {'warden'})
+        with app.app_context():
+            login_as(self.client, create_user())
+        self.assertNotEqual(self.client.get('/warden/logs/export.csv').status_code, 200)
+
+    def test_bad_date_is_rejected(self):
+        self.assertEqual(self.client.get('/export/orders.jsonl?start=March').status_code, 400)
+
+# Bulk Part Import/Export Tests
+class PartsImportExportTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        with app.app_context():
+            db.create_all()
+            db.session.add(Part(name='Old Name', model_number='IMP001', count=4, cost=1.0, room='Kitchen'))
+            db.session.commit()
+
+    def tearDown(self):
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_csv_upsert_by_model_number(self):
+        rows = read_parts(io.StringIO("model_number,name,cost\nIMP001,New Name,2.50\nIMP002,Fresh Part,\n"), 'csv')
+        with app.app_context():
+            self.assertEqual(upsert_parts(db.session, Part, rows, batch_size=1), (1, 1))
+            updated = Part.query.filter_by(model_number='IMP001').one()
+            # Columns absent from the file keep their values.
+            self.assertEqual((updated.name, updated.cost, updated.count), ('New Name', 2.5, 4))
+            added = Part.query.filter_by(model_number='IMP002').one()
+            self.assertEqual((added.cost, added.count, added.threshold), (None, 0, 5))
+
+    def test_jsonl_round_trip(self):
+        out = io.StringIO()
+        with app.app_context():
+            self.assertEqual(export_parts(db.session, Part, out, 'jsonl'), 1)
+            db.session.query(Part).delete()
+            db.session.commit()
+            out.seek(0)
+            self.assertEqual(upsert_parts(db.session, Part, read_parts(out, 'jsonl')), (1, 0))
+            part = Part.query.one()
+            self.assertEqual((part.model_number, part.name, part.count), ('IMP001', 'Old Name', 4))
+
+# Query Budget Tests: each route issues a fixed number of statements however
+# many rows it shows, so N+1 patterns fail here before they ship.
+class QueryBudgetTests(unittest.TestCase):
+    YEAR = date.today().year
+    # Pages served with conditional_get include the one data_version read.
+    BUDGETS = {
+        '/': 3,
+        '/?search=Part': 3,
+        '/api/alerts': 2,
+        '/combined': 5,
+        f'/history?year={YEAR}': 1,
+        f'/history?year={YEAR}&month={date.today().month}': 2,
+        '/budget': 1,
+        '/trends': 1,
+        f'/turn?year={YEAR}': 2,
+        '/warden/logs': 2,
+    }
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['BUDGET_REFRESH_INTERVAL'] = 0
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = (budget_sheet.client, budget_sheet.snapshot_path)
+        budget_sheet.client = StaticSheetClient([['Line', 'JAN'], ['Appliance Parts', '10']])
+        budget_sheet.snapshot_path = os.path.join(self.tmpdir.name, 'budget_snapshot.json')
+
+    def tearDown(self):
+        budget_sheet.client, budget_sheet.snapshot_path = self.saved
+        self.tmpdir.cleanup()
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def seed(self, size):
+        today = date.today()
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            user_id = create_user('warden', 'warden')
+            db.session.execute(insert(Part), [
+                dict(name=f'Part {i}', model_number=f'QB{i:05d}', count=i % 7, cost=1.0, room='Kitchen',
+                     appliance_type='Oven', threshold=5, order_link='http://example.com', order_status='Not Ordered')
+                for i in range(size)])
+            db.session.execute(insert(OrderHistory), [
+                dict(part_id=i + 1, purchased_quantity=1, total_cost=1.0, order_date=today,
+                     delivered_date=today if i % 2 else None, expense_line='Appliances')
+                for i in range(size)])
+            db.session.execute(insert(ActionLog), [
+                dict(user_id=user_id, action='update', entity='Part', entity_id=i + 1, timestamp=datetime.now())
+                for i in range(size)])
+            db.session.execute(insert(TurnTask), list(build_turn_rows(self.YEAR, TURN_LAYOUT, TURN_LAYOUT['tasks']))[:size])
+            db.session.commit()
+        client = app.test_client()
+        login_as(client, user_id)
+        counts = {}
+        for url in self.BUDGETS:
+            client.get(url)  # warm the per-process caches (user loader, /turn options)
+            counts[url] = count_statements(client, url)
+        return counts
+
+    def test_statement_count_does_not_grow_with_rows(self):
+        small, large = self.seed(10), self.seed(1000)
+        for url, budget in self.BUDGETS.items():
+            with self.subTest(url=url):
+                self.assertEqual(small[url], large[url])
+                self.assertLessEqual(large[url], budget)
+
+# Request Metrics Tests
+class MetricsTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        request_metrics.reset()
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Part(name='Gauge', model_number='MET001', count=1, cost=1.0, room='Other', threshold=3))
+            db.session.commit()
+            self.warden_id = create_user('warden', 'warden')
+            login_as(self.client, self.warden_id)
+
+    def tearDown(self):
+        request_metrics.sample_rate = 1.0
+        app.config['METRICS_TOKEN'] = None
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_records_queries_and_size_per_endpoint(self):
+        self.client.get('/api/alerts')
+        self.client.get('/api/alerts')
+        alerts = request_metrics.snapshot()['api_alerts']
+        self.assertEqual(alerts['duration'].count, 2)
+        self.assertGreaterEqual(alerts['queries'].max, 1)
+        self.assertGreater(alerts['response_size'].total, 0)
+        self.assertIn(b'api_alerts', self.client.get('/warden/metrics').data)
+
+    def test_prometheus_text_needs_token_or_warden(self):
+        self.client.get('/api/alerts')
+        app.config['METRICS_TOKEN'] = 'scrape-me'
+        anonymous = app.test_client()
+        self.assertEqual(anonymous.get('/metrics').status_code, 403)
+        response = anonymous.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+        text = response.get_data(as_text=True)
+        self.assertIn('ims_request_sql_queries_count{endpoint="api_alerts"} 1', text)
+        self.assertIn('# TYPE ims_request_duration_seconds histogram', text)
+
+    def test_sampling_rate_zero_records_nothing(self):
+        request_metrics.sample_rate = 0.0
+        self.client.get('/api/alerts')
+        self.assertEqual(request_metrics.snapshot(), {})
+
+# SQLite Engine Profile Tests
+class EngineProfileTests(unittest.TestCase):
+    def test_file_database_connections_use_wal_and_busy_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'profile.db')}")
+            with engine.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
+                self.assertEqual(conn.exec_driver_sql('PRAGMA busy_timeout').scalar(),
+                                 app.config['SQLITE_PRAGMAS']['busy_timeout'])
+                self.assertEqual(conn.exec_driver_sql('PRAGMA synchronous').scalar(), 1)  # NORMAL
+            engine.dispose()
+
+# Outbound Mail Queue Tests
+class FakeSMTP:
+    # Records what a real connection would send; fails the first `fail` sends,
+    # and refuses every recipient with `refuse_code` when that is set.
+    connections = 0
+
+    def __init__(self, fail=0):
+        FakeSMTP.connections += 1
+        self.fail = fail
+        self.refuse_code = None
+        self.sent = []
+
+    def sendmail(self, from_address, to_addresses, message):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionResetError('connection dropped')
+        if self.refuse_code:
+            raise smtplib.SMTPRecipientsRefused({to: (self.refuse_code, b'refused') for to in to_addresses})
+        self.sent.append((from_address, to_addresses, message))
+
+    def quit(self):
+        pass
+
+class MailQueueTests(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        app.config['MAIL_WORKER'] = False
+        FakeSMTP.connections = 0
+        self.smtp = FakeSMTP()
+        with app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        app.config['MAIL_WORKER'] = True
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def worker(self, **kwargs):
+        return MailWorker(get_engine, OutboundEmail.__table__, lambda: self.smtp, **kwargs)
+
+    def queue(self, count):
+        with app.app_context():
+            for i in range(count):
+                queue_email(f'user{i}@example.com', 'Verify Your Email for IMS', f'Hi user{i}')
+            db.session.commit()
+
+    def test_batch_sent_over_one_connection(self):
+        self.queue(3)
+        self.assertEqual(self.worker().run_once(), 3)
+        self.assertEqual(FakeSMTP.connections, 1)
+        self.assertEqual([to for _, to, _ in self.smtp.sent],
+                         [['user0@example.com'], ['user1@example.com'], ['user2@example.com']])
+        with app.app_context():
+            self.assertEqual({e.status for e in OutboundEmail.query.all()}, {'sent'})
+
+    def test_failed_send_backs_off_then_gives_up(self):
+        self.queue(1)
+        self.smtp.fail = 2
+        worker = self.worker(max_attempts=2, backoff=60)
+        self.assertEqual(worker.run_once(), 0)
+        with app.app_context():
+            email = OutboundEmail.query.one()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreater(email.next_attempt_at, datetime.utcnow() + timedelta(seconds=30))
+            # Not due yet, so the next pass leaves it alone.
+            self.assertEqual(worker.run_once(), 0)
+            email.next_attempt_at = datetime.utcnow()
+            db.session.commit()
+        worker.run_once()
+        with app.app_context():
+            email = OutboundEmail.query.one()
+            self.assertEqual((email.status, email.attempts), ('failed', 2))
+            self.assertIn('connection dropped', email.last_error)
+
+    def test_refused_recipient_fails_at_once_only_when_permanent(self):
+        self.queue(1)
+        self.smtp.refuse_code = 450
+        worker = self.worker(max_attempts=5, backoff=60)
+        worker.run_once()
+        with app.app_context():
+            email = OutboundEmail.query.one()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            email.next_attempt_at = datetime.utcnow()
+            db.session.commit()
+        self.smtp.refuse_code = 550
+        worker.run_once()
+        with app.app_context():
+            email = OutboundEmail.query.one()
+            self.assertEqual((email.status, email.attempts), ('failed', 2))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+import os
+import re
+import unittest
+from datetime import datetime, date
+from sqlalchemy import event
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import app, db, Part, OrderHistory, TurnTask, ActionLog, budget_sheet, encode_cursor
+from budget_sheet import StaticSheetClient
+from test_app import create_user, login_as
+
+# Tables a route may still read end to end, and why.
+ALLOWED_SCANS = {
+    # Exports read every row by design, in primary key order.
+    '/export/orders.csv': {'order_history'},
+}
+
+SCAN = re.compile(r'^SCAN (\w+)(.*)$')
+
+
+# Query Plan Regression Tests: every SELECT a route issues must use an index
+# (or the rowid) for each table it touches, never a plain full table scan.
+class QueryPlanTests(unittest.TestCase):
+    ROUTES = [
+        '/',
+        '/?search=filter',
+        '/?room=Kitchen&appliance=Oven',
+        '/combined',
+        '/combined/delivered?after=' + encode_cursor('2025-02-01', 99),
+        '/api/alerts',
+        '/history?year=2025',
+        '/history?year=2025&month=1',
+        '/budget?q=1',
+        '/turn?year=2025&building=A&floor=1',
+        '/export/orders.csv',
+        '/warden/logs',
+        '/warden/logs/export.jsonl?user=warden&start=2025-01-01',
+        '/warden/logs?user=warden&entity=Part&action=update',
+    ]
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['BUDGET_REFRESH_INTERVAL'] = 0
+        self.saved_sheet_client = budget_sheet.client
+        budget_sheet.client = StaticSheetClient([['Line', 'JAN'], ['Appliance Parts', '10']])
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            user_id = create_user('warden', 'warden')
+            part = Part(name='Furnace Filter', model_number='QP001', count=1, cost=5.0, room='Kitchen',
+                        appliance_type='Oven', order_link='http://example.com')
+            db.session.add(part)
+            db.session.flush()
+            db.session.add_all([
+                OrderHistory(part_id=part.id, purchased_quantity=1, total_cost=5.0,
+                             delivered_date=date(2025, 1, 5), expense_line='Appliances'),
+                OrderHistory(part_id=part.id, purchased_quantity=1, total_cost=5.0),
+                TurnTask(year=2025, building='A', side='East', floor=1, unit_number='A-101', task_name='Paint'),
+                ActionLog(user_id=user_id, action='update', entity='Part', entity_id=part.id,
+                          timestamp=datetime(2025, 1, 5)),
+            ])
+            db.session.commit()
+            login_as(self.client, user_id)
+
+    def tearDown(self):
+        budget_sheet.client = self.saved_sheet_client
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def capture_selects(self, url):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                response = self.client.get(url)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200, url)
+        return statements
+
+    def full_scans(self, statement, parameters):
+        tables = set(db.metadata.tables)
+        with db.engine.connect() as conn:
+            plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        scans = set()
+        for row in plan:
+            match = SCAN.match(row[-1])
+            if match and match.group(1) in tables and 'INDEX' not in match.group(2):
+                scans.add(match.group(1))
+        return scans
+
+    def test_routes_use_indexes(self):
+        for url in self.ROUTES:
+            statements = self.capture_selects(url)
+            with self.subTest(url=url), app.app_context():
+                for statement, parameters in statements:
+                    scans = self.full_scans(statement, parameters) - ALLOWED_SCANS.get(url, set())
+                    self.assertFalse(scans, f"{url} scans {sorted(scans)}:\n{statement}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+### Turn task seeding ###
+# Each summer turn every unit gets the same checklist. The property layout and
+# the checklist come from a JSON file (see load_layout); seed_turn_tasks()
+# expands them for a year and bulk-inserts the rows that don't exist yet.
+#
+#   {"tasks": ["Paint", "Deep Clean"],
+#    "buildings": [{"name": "A", "sides": ["East", "West"], "floors": 3, "units_per_side": 4}]}
+#
+# A building may carry its own "tasks" list. Unit numbers are
+# <building>-<floor><nn>, counting through the sides in order.
+import json
+from sqlalchemy import insert
+
+
+def load_layout(path):
+    # Raises ValueError when the file is missing or incomplete.
+    try:
+        with open(path, encoding="utf-8") as f:
+            layout = json.load(f)
+    except FileNotFoundError:
+        raise ValueError(f"No turn layout configured: {path} does not exist") from None
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+    if not isinstance(layout, dict) or not isinstance(layout.get("buildings"), list) or not layout["buildings"]:
+        raise ValueError(f"{path}: layout needs a non-empty \"buildings\" list")
+    for i, building in enumerate(layout["buildings"], 1):
+        problem = building_problem(building, layout.get("tasks"))
+        if problem:
+            name = building.get("name") if isinstance(building, dict) else None
+            raise ValueError(f"{path}: building {name or f'#{i}'!r}: {problem}")
+    return layout
+
+
+def is_count(value):
+    return type(value) is int and value > 0
+
+
+def is_name_list(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(v, str) and v for v in value)
+
+
+def building_problem(building, default_tasks):
+    # What is wrong with one "buildings" entry, or None.
+    if not isinstance(building, dict):
+        return "expected a JSON object"
+    if not isinstance(building.get("name"), str) or not building["name"]:
+        return "\"name\" must be a non-empty string"
+    if not is_name_list(building.get("sides")):
+        return "\"sides\" must be a non-empty list of names"
+    for field in ("floors", "units_per_side"):
+        if not is_count(building.get(field)):
+            return f"\"{field}\" must be a positive whole number"
+    if not is_name_list(building.get("tasks", default_tasks)):
+        return "no task list (give \"tasks\" on the layout or the building)"
+    return None
+
+
+def build_turn_rows(year, layout, tasks):
+    for building in layout["buildings"]:
+        name = building["name"]
+        building_tasks = building.get("tasks", tasks)
+        for floor in range(1, building["floors"] + 1):
+            number = 0
+            for side in building["sides"]:
+                for _ in range(building["units_per_side"]):
+                    number += 1
+                    unit_number = f"{name}-{floor}{number:02d}"
+                    for task_name in building_tasks:
+                        yield {
+                            "year": year,
+                            "building": name,
+                            "side": side,
+                            "floor": floor,
+                            "unit_number": unit_number,
+                            "task_name": task_name,
+                            "is_completed": False,
+                        }
+
+
+def seed_turn_tasks(session, model, year, layout, chunk_size=1000):
+    # Inserts the (unit, task) rows missing for `year` in executemany chunks and
+    # returns how many were added, so re-running it is safe. The caller commits.
+    tasks = layout.get("tasks")
+    existing = set(session.query(model.unit_number, model.task_name).filter(model.year == year))
+    inserted = 0
+    chunk = []
+    for row in build_turn_rows(year, layout, tasks):
+        if (row["unit_number"], row["task_name"]) in existing:
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            session.execute(insert(model), chunk)
+            inserted += len(chunk)
+            chunk = []
+    if chunk:
+        session.execute(insert(model), chunk)
+        inserted += len(chunk)
+    return inserted